@@ -0,0 +1,168 @@
+import threading
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+try:
+    StopAsyncIteration
+except NameError:
+    #Python 2 (trollius) has no async for: the end of the documents is signalled by StopIteration
+    StopAsyncIteration = StopIteration
+
+_DONE = object()
+
+
+def _import_asyncio():
+    try:
+        import asyncio
+    except ImportError:
+        try:
+            import trollius as asyncio
+        except ImportError:
+            raise ImportError('AsyncDataProducer requires asyncio, or trollius on Python 2.')
+    return asyncio
+
+
+class _Failure(object):
+    def __init__(self,error):
+        self.error = error
+
+
+class BackgroundProducer(object):
+    '''Generate documents on worker threads, batch_size at a time, into a queue holding at most prefetch batches:
+    generation runs ahead of the consumer, but only by that much. Iterating yields count documents, or never stops
+    if count is None. Several workers need a DataProducer created with thread_safe=True.'''
+    def __init__(self,producer,count = None,batch_size = 100,prefetch = 4,workers = 1):
+        if workers > 1 and not producer.thread_safe:
+            raise ValueError('Several workers need a DataProducer created with thread_safe=True')
+        self.producer = producer
+        self.remaining = count
+        self.batch_size = batch_size
+        self.queue = queue.Queue(prefetch)
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+        self.running = workers
+        self.batch = []
+        self.threads = [threading.Thread(target = self.__work) for i in range(0,workers)]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if not self.batch:
+            batch = self.get_batch()
+            if batch is None:
+                raise StopIteration
+            batch.reverse()
+            self.batch = batch
+        return self.batch.pop()
+
+    __next__ = next
+
+    def get_batch(self):
+        '''Block until a batch is generated and return it, or None once all the documents have been returned.
+        An exception raised while generating is raised here.'''
+        while self.running:
+            item = self.queue.get()
+            if item is _DONE:
+                self.running -= 1
+            elif isinstance(item,_Failure):
+                self.close()
+                raise item.error
+            else:
+                return item
+        return None
+
+    def close(self):
+        '''Stop the workers. They exit after the batch they are generating, if any.'''
+        self.stopped.set()
+        self.running = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        self.close()
+
+    def __work(self):
+        try:
+            while not self.stopped.is_set():
+                size = self.__reserve()
+                if not size:
+                    break
+                self.__put(self.producer.produce_batch(size))
+        except Exception as e:
+            self.__put(_Failure(e))
+        self.__put(_DONE)
+
+    def __reserve(self):
+        with self.lock:
+            if self.remaining is None:
+                return self.batch_size
+            size = min(self.batch_size,self.remaining)
+            self.remaining -= size
+            return size
+
+    def __put(self,item):
+        #a full queue blocks the worker: that is the backpressure; the timeout only lets it notice close()
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item,timeout = 0.1)
+                return
+            except queue.Full:
+                pass
+
+
+class AsyncDataProducer(object):
+    '''asyncio interface to a BackgroundProducer. With trollius on Python 2, which has no async for:
+
+        documents = AsyncDataProducer(producer,prefetch = 8)
+        while True:
+            try:
+                document = yield From(documents.__anext__())
+            except StopIteration:
+                break
+
+    Documents are generated on worker threads. Waiting for the next batch runs in the event loop's default executor,
+    so the loop keeps serving other tasks meanwhile instead of being blocked by generation.'''
+    def __init__(self,producer,count = None,batch_size = 100,prefetch = 4,workers = 1,loop = None):
+        self.asyncio = _import_asyncio()
+        self.loop = loop
+        self.background = BackgroundProducer(producer,count,batch_size,prefetch,workers)
+        self.batch = []
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        '''A future of the next document.'''
+        loop = self.loop or self.asyncio.get_event_loop()
+        future = self.asyncio.Future(loop = loop)
+        if self.batch:
+            future.set_result(self.batch.pop())
+            return future
+
+        def batch_done(batch_future):
+            if batch_future.exception() is not None:
+                if not future.cancelled():
+                    future.set_exception(batch_future.exception())
+                return
+            batch = batch_future.result()
+            if batch is None:
+                if not future.cancelled():
+                    future.set_exception(StopAsyncIteration())
+                return
+            batch.reverse()
+            self.batch = batch
+            if not future.cancelled():
+                future.set_result(self.batch.pop())
+
+        loop.run_in_executor(None,self.background.get_batch).add_done_callback(batch_done)
+        return future
+
+    def close(self):
+        self.background.close()
@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+'''Benchmarks of json_schema_express.
+
+For every schema of sample_schemas/ and a few large synthetic ones, measures DataProducer construction time,
+produce() latency, produce_list() and produce_batch() throughput and peak memory, each schema in a fresh interpreter.
+The memory a producer holds per field of a very wide schema is measured
+too. Results are printed (or saved with --output) as JSON; with --baseline, they are compared against a previous output
+and regressions beyond --threshold make the run exit with status 1.
+
+    python benchmark.py --output baseline.json
+    python benchmark.py --baseline baseline.json wide deep'''
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+#dependencies that importing the producer must not load: each is imported by the generator or feature that needs it
+HEAVY_MODULES = ('faker','rstr','jsonschema','numpy','multiprocessing','httplib','socket','ssl')
+
+IMPORT_SCRIPT = '''
+import sys,time,json
+start = time.time()
+import %s
+seconds = time.time()-start
+print json.dumps({"seconds":seconds,"modules":sorted(set(name.split('.')[0] for name in sys.modules if sys.modules[name]))})
+'''
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+SAMPLE_DIR = os.path.join(PACKAGE_DIR,'sample_schemas')
+
+#metrics compared against the baseline, and whether a higher value is a regression
+METRICS = {
+    'init_seconds': True,
+    'produce_median_seconds': True,
+    'produce_p95_seconds': True,
+    'produce_list_per_second': False,
+    'produce_batch_per_second': False,
+    'peak_rss_kb': True,
+    'bytes_per_field': True,
+}
+
+
+def import_time(module = 'data_producer',runs = 5):
+    '''Import module in runs fresh interpreters. Returns the median import time in seconds, and the heavy
+    dependencies the import loaded.'''
+    timings = []
+    modules = set()
+    for i in range(0,runs):
+        output = subprocess.check_output([sys.executable,'-c',IMPORT_SCRIPT % module],cwd = PACKAGE_DIR)
+        result = json.loads(output)
+        timings.append(result['seconds'])
+        modules.update(result['modules'])
+    timings.sort()
+    return {'module':module,'runs':runs,'seconds':timings[len(timings)//2],
+            'heavy_modules':sorted(modules.intersection(HEAVY_MODULES))}
+
+
+def wide_schema(width = 500,distinct = False):
+    '''One object with width properties of every leaf type. With distinct, every property but the
+    booleans (which take no constraint) has a definition of its own.'''
+    leaves = [
+        {"type":"integer","minimum":0,"maximum":1000},
+        {"type":"number","minimum":0,"maximum":1},
+        {"type":"string","minLength":5,"maxLength":20},
+        {"type":"boolean"},
+        {"type":"string","pattern":"[A-Z]{2}-[0-9]{4,6}"},
+        {"type":"string","enum":["red","green","blue"]}
+    ]
+    properties = {}
+    for i in range(0,width):
+        leaf = dict(leaves[i % len(leaves)])
+        if distinct:
+            if 'enum' in leaf:
+                leaf['enum'] = leaf['enum']+[str(i)]
+            elif leaf['type'] == 'boolean':
+                pass
+            elif 'pattern' in leaf:
+                leaf['pattern'] += '-{0}'.format(i)
+            else:
+                leaf['maximum' if 'maximum' in leaf else 'maxLength'] += i
+        properties['field{0}'.format(i)] = leaf
+    return {"type":"object","properties":properties,"required":sorted(properties.keys())}
+
+
+def deep_schema(depth = 30):
+    '''Objects nested depth levels deep, with a few leaves on every level.'''
+    schema = {"type":"object","properties":{"id":{"type":"integer"},"name":{"type":"string"}},"required":["id","name"]}
+    for i in range(0,depth):
+        schema = {
+            "type":"object",
+            "properties":{"id":{"type":"integer"},"name":{"type":"string"},"child":schema},
+            "required":["id","name","child"]
+        }
+    return schema
+
+
+def big_array_schema(size = 1000):
+    '''Large arrays of scalars and of small objects.'''
+    return {
+        "type":"object",
+        "properties":{
+            "integers":{"type":"array","minItems":size,"maxItems":size,"items":{"type":"integer"}},
+            "unique":{"type":"array","minItems":size,"maxItems":size,"uniqueItems":True,"items":{"type":"integer","minimum":0,"maximum":size*2}},
+            "strings":{"type":"array","minItems":size//2,"maxItems":size//2,"items":{"type":"string"}},
+            "objects":{
+                "type":"array",
+                "minItems":size//5,
+                "maxItems":size//5,
+                "items":{
+                    "type":"object",
+                    "properties":{"x":{"type":"number"},"y":{"type":"number"},"label":{"type":"string"}},
+                    "required":["x","y","label"]
+                }
+            }
+        },
+        "required":["integers","unique","strings","objects"]
+    }
+
+
+def ref_heavy_schema(refs = 200):
+    '''Many properties referring to the same definitions, which refer to each other.'''
+    properties = {}
+    for i in range(0,refs):
+        properties['person{0}'.format(i)] = {"$ref":"#/definitions/person"}
+    return {
+        "type":"object",
+        "definitions":{
+            "address":{
+                "type":"object",
+                "properties":{"street":{"type":"string"},"city":{"type":"string"},"zip":{"type":"string","pattern":"[0-9]{5}"}},
+                "required":["street","city","zip"]
+            },
+            "person":{
+                "type":"object",
+                "properties":{"name":{"type":"string"},"age":{"type":"integer","minimum":0,"maximum":120},"home":{"$ref":"#/definitions/address"},"work":{"$ref":"#/definitions/address"}},
+                "required":["name","age","home"]
+            }
+        },
+        "properties":properties,
+        "required":sorted(properties.keys())
+    }
+
+
+def format_schema(fields = 100):
+    '''Many fields with a format.'''
+    formats = [
+        {"type":"string","format":"email"},
+        {"type":"string","format":"ipv4"},
+        {"type":"string","format":"ipv6"},
+        {"type":"string","format":"uri"},
+        {"type":"string","format":"hostname"},
+        {"type":"string","format":"date-time","_generator_config":{}}
+    ]
+    properties = {}
+    for i in range(0,fields):
+        properties['field{0}'.format(i)] = dict(formats[i % len(formats)])
+    return {"type":"object","properties":properties,"required":sorted(properties.keys())}
+
+
+SYNTHETIC_SCHEMAS = {
+    'wide':wide_schema,
+    'deep':deep_schema,
+    'big_array':big_array_schema,
+    'ref_heavy':ref_heavy_schema,
+    'formats':format_schema,
+}
+
+
+def schema_names():
+    '''Names of all benchmarked schemas: the sample schemas (but the remote one) by file name, and the synthetic ones.'''
+    samples = [f for f in sorted(os.listdir(SAMPLE_DIR)) if f.startswith('test_') and 'remote' not in f]
+    return samples+sorted(SYNTHETIC_SCHEMAS.keys())
+
+
+def load_schema(name):
+    '''Return (schema, json_file_dir) for a benchmarked schema.'''
+    if name in SYNTHETIC_SCHEMAS:
+        return (SYNTHETIC_SCHEMAS[name](),'.')
+    with open(os.path.join(SAMPLE_DIR,name),'rb') as f:
+        return (json.load(f),SAMPLE_DIR)
+
+
+def measure(name,runs = 5,count = 200):
+    '''Benchmark one schema in the current process: median DataProducer construction time over runs, produce()
+    latency over count documents, produce_list(count) and produce_batch(count) throughput, and peak memory.'''
+    import resource
+    from copy import deepcopy
+    from timeit import default_timer as timer
+    from data_producer import DataProducer
+
+    (schema,json_file_dir) = load_schema(name)
+    rss_start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    init_timings = []
+    for i in range(0,runs):
+        copy = deepcopy(schema)
+        start = timer()
+        #uncached: construction includes validation and $ref resolution
+        producer = DataProducer(copy,json_file_dir,seed = 0,schema_cache = False)
+        init_timings.append(timer()-start)
+    latencies = []
+    for i in range(0,count):
+        start = timer()
+        producer.produce()
+        latencies.append(timer()-start)
+    start = timer()
+    producer.produce_list(count)
+    list_seconds = timer()-start
+    start = timer()
+    producer.produce_batch(count)
+    batch_seconds = timer()-start
+    rss_end = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    init_timings.sort()
+    latencies.sort()
+    return {
+        'init_seconds':init_timings[len(init_timings)//2],
+        'produce_median_seconds':latencies[len(latencies)//2],
+        'produce_p95_seconds':latencies[int(len(latencies)*0.95)],
+        'produce_max_seconds':latencies[-1],
+        'produce_list_per_second':count/max(list_seconds,1e-9),
+        'produce_batch_per_second':count/max(batch_seconds,1e-9),
+        'peak_rss_kb':rss_end,
+        'rss_growth_kb':rss_end-rss_start,
+    }
+
+
+def _rss_bytes():
+    '''Current resident memory, or None where /proc is not available.'''
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1])*os.sysconf('SC_PAGE_SIZE')
+    except (IOError,OSError,ValueError):
+        return None
+
+
+def field_memory(fields = 20000,distinct = False):
+    '''Resident memory a DataProducer holds per field of wide_schema(fields), in the current process: the growth of
+    the RSS while the producer is built, imports and the schema itself excluded.'''
+    import gc
+    from data_producer import DataProducer
+
+    DataProducer(wide_schema(6),seed = 0).produce()
+    schema = wide_schema(fields,distinct)
+    gc.collect()
+    rss_start = _rss_bytes()
+    producer = DataProducer(schema,seed = 0)
+    gc.collect()
+    rss_end = _rss_bytes()
+    if rss_start is None:
+        return {'fields':fields,'distinct':distinct,'bytes_per_field':None}
+    return {'fields':fields,'distinct':distinct,'bytes_per_field':float(rss_end-rss_start)/fields}
+
+
+def _field_memory_subprocess(fields,distinct):
+    command = [sys.executable,os.path.abspath(__file__),'--field-memory',str(fields)]
+    if distinct:
+        command.append('--distinct')
+    return json.loads(subprocess.check_output(command,cwd = PACKAGE_DIR))
+
+
+def run(names = None,runs = 5,count = 200,import_runs = 5,fields = 20000):
+    '''Run the benchmarks, every schema in a fresh interpreter so that memory and caches do not carry over.'''
+    results = {'python':sys.version.split()[0],'runs':runs,'count':count,'schemas':{}}
+    if import_runs:
+        results['import'] = import_time(runs = import_runs)
+    for name in names or schema_names():
+        output = subprocess.check_output([sys.executable,os.path.abspath(__file__),'--measure',name,'--runs',str(runs),'--count',str(count)],cwd = PACKAGE_DIR)
+        results['schemas'][name] = json.loads(output)
+    if fields:
+        #reported as pseudo schemas, so that compare() checks them against the baseline like the others
+        results['schemas']['field_memory'] = _field_memory_subprocess(fields,False)
+        results['schemas']['field_memory_distinct'] = _field_memory_subprocess(fields,True)
+    return results
+
+
+def compare(results,baseline,threshold = 0.2):
+    '''Regressions of results against baseline: metrics worse by more than threshold (a fraction) for schemas
+    present in both.'''
+    regressions = []
+    for name in sorted(results['schemas'].keys()):
+        if name not in baseline.get('schemas',{}):
+            continue
+        for metric,higher_is_worse in sorted(METRICS.items()):
+            current = results['schemas'][name].get(metric)
+            previous = baseline['schemas'][name].get(metric)
+            if not current or not previous:
+                continue
+            ratio = float(current)/previous
+            if (higher_is_worse and ratio > 1+threshold) or (not higher_is_worse and ratio < 1/(1+threshold)):
+                regressions.append({'schema':name,'metric':metric,'baseline':previous,'current':current,'ratio':ratio})
+    if 'import' in results and 'import' in baseline:
+        ratio = results['import']['seconds']/baseline['import']['seconds']
+        if ratio > 1+threshold:
+            regressions.append({'schema':None,'metric':'import_seconds','baseline':baseline['import']['seconds'],
+                                'current':results['import']['seconds'],'ratio':ratio})
+    return regressions
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Benchmark json_schema_express.')
+    parser.add_argument('schemas',nargs = '*',help = 'schemas to benchmark: sample schema file names or '+', '.join(sorted(SYNTHETIC_SCHEMAS.keys())))
+    parser.add_argument('--runs',type = int,default = 5,help = 'DataProducer constructions per schema')
+    parser.add_argument('--count',type = int,default = 200,help = 'documents per generation benchmark')
+    parser.add_argument('--import-runs',type = int,default = 5,help = 'interpreters started to time the import, 0 to skip it')
+    parser.add_argument('--output',help = 'save the results to this file')
+    parser.add_argument('--baseline',help = 'compare against the results saved in this file')
+    parser.add_argument('--threshold',type = float,default = 0.2,help = 'relative change reported as a regression')
+    parser.add_argument('--fields',type = int,default = 20000,help = 'properties of the schema measuring memory per field, 0 to skip it')
+    parser.add_argument('--measure',help = argparse.SUPPRESS)
+    parser.add_argument('--field-memory',type = int,help = argparse.SUPPRESS)
+    parser.add_argument('--distinct',action = 'store_true',help = argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.measure:
+        print json.dumps(measure(args.measure,args.runs,args.count))
+        return 0
+    if args.field_memory:
+        print json.dumps(field_memory(args.field_memory,args.distinct))
+        return 0
+    results = run(args.schemas,args.runs,args.count,args.import_runs,args.fields)
+    if args.baseline:
+        with open(args.baseline,'rb') as f:
+            results['regressions'] = compare(results,json.load(f),args.threshold)
+    if args.output:
+        with open(args.output,'wb') as f:
+            json.dump(results,f,indent = 4,sort_keys = True)
+    print json.dumps(results,indent = 4,sort_keys = True)
+    return 1 if results.get('regressions') else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,27 +1,60 @@
 #!/usr/bin/env python
 
 import json
+import io
 import sys
 import os
 import random
-from jsonschema import Draft4Validator
-from jsonspec.pointer import extract
-
-import codecs
-
-import urllib2
+import inspect
+import hashlib
+import threading
+from copy import copy, deepcopy
 
 from generators import *
+from numpy_generators import *
+from resolver import RefResolver
+from document_cache import default_cache
+from schema_cache import ResolvedSchema, default_schema_cache, fingerprint, canonical
+from plan import ObjectNode, ArrayNode, TupleNode, LeafNode, NullNode, RefNode, ExpansionBudget, compile_refs, draws_per_document
+from profiling import Profiler
+from registry import registry
 
 
 class DataProducer:
-    def __init__(self,schema,json_file_dir = '.',generator_mapping = None):
+    def __init__(self,schema,json_file_dir = '.',generator_mapping = None,seed = None,rng = None,max_ref_depth = 10,max_ref_expansions = 1000,document_cache = None,profile = False,vectorised = False,thread_safe = False,schema_cache = None):
         self.schema = schema
+        self.random = rng or random.Random(seed)
+        #seed of produce_at(), drawn on first use when None
+        self.master_seed = seed
+        self.seeker = None
         self.generator_cache = {}
+        #generators of stateless registrations, shared by the keys with identical definitions
+        self.leaf_generators = {}
+        self.generator_registrations = {}
         self.object_defines = {}
         self.refered_jsons = {}
+        self.recursive_refs = {}
+        self.compiled_refs = {}
+        self.budget = ExpansionBudget(max_ref_depth,max_ref_expansions)
         self.base_dir = json_file_dir
         self.base_uri = ''
+        self.document_cache = document_cache
+        self.schema_cache = default_schema_cache if schema_cache is True else schema_cache
+        self.resolver = None
+        self.profiler = Profiler() if profile else None
+        self.vectorised = vectorised
+        self.thread_safe = thread_safe
+        if thread_safe:
+            if profile:
+                raise ValueError('Profiling is not supported in thread-safe mode')
+            #generators declared thread-safe are shared by the threads, and draw from this RNG
+            self.shared_generators = {}
+            self.shared_random = self.random
+            self.generation = 0
+            self.__local = threading.local()
+            self.__lock = threading.Lock()
+        else:
+            self.shared_generators = None
         self.type_vs_generator = {
             "number":"StdNumberRandom",
             "boolean":"StdBooleanRandom",
@@ -47,9 +80,43 @@ class DataProducer:
                 self.type_vs_generator[key] = value
 
         self.__parse_schema()
+        self.plan = self.__compile_object('root',self.object_defines['root'])
 
     def __parse_schema(self):
+        '''Validate the schema and resolve its $refs, or reuse the ResolvedSchema of an identical schema from the
+        schema cache, if any. schema may also be a ResolvedSchema itself. Producers reusing a cached entry share its
+        schema, which must not be edited.'''
+        if isinstance(self.schema,ResolvedSchema):
+            resolved = self.schema
+        elif not self.schema_cache or self.__cache_key() is None:
+            resolved = self.__resolve_schema()
+        else:
+            key = self.__cache_key()
+            resolved = self.schema_cache.get(key,self.document_cache or default_cache)
+            if resolved is None:
+                resolved = self.__resolve_schema()
+                #the cache keeps a copy of its own: the caller's schema, resolved in place, may be edited afterwards
+                cached = deepcopy(resolved)
+                self.schema_cache.put(key,cached)
+                if resolved.root is self.schema and self.resolver.targets:
+                    #$refs were replaced in the caller's schema itself: it hits the cache in its new form too
+                    self.schema_cache.put(self.__cache_key(),cached)
+        self.resolved = resolved
+        self.schema = self.object_defines['root'] = resolved.root
+        self.base_uri = resolved.base_uri
+        self.recursive_refs = resolved.recursive_refs
+
+    def __cache_key(self):
+        '''The fingerprint of the schema, or None if it holds values JSON cannot encode (e.g. a generator class in
+        _generator_config): such schemas are not cached.'''
+        try:
+            return fingerprint(self.schema,self.base_dir)
+        except (TypeError,ValueError):
+            return None
+
+    def __resolve_schema(self):
         if '$schema' not in self.schema or self.schema['$schema'].find('draft-03') == -1:
+            from jsonschema import Draft4Validator
             Draft4Validator.check_schema(self.schema)
         else:
             raise ValueError("Draft-03 schema is not supported currently.")
@@ -58,52 +125,19 @@ class DataProducer:
         if 'id' in self.schema:
             self.base_uri = self.schema['id']
 
-        self.__parse_object('root',self.schema)
+        self.resolver = RefResolver(self.schema,self.base_dir,self.base_uri,self.document_cache)
+        self.refered_jsons = self.resolver.documents
+        self.__parsed = set()
+        self.__walking = set()
+        self.__recursive = []
+        self.__parse_object(self.object_defines,'root',self.schema)
+        resolved = ResolvedSchema(self.object_defines['root'],self.__recursive,self.base_uri,dict(self.resolver.digests))
+        #only needed while walking: one id per definition of the schema
+        del self.__parsed,self.__walking,self.__recursive
+        return resolved
 
 
-    def __get_refered_json(self,json_file = ''):
-        if not self.base_uri and not json_file:
-            #refer to itself
-            return self.schema
-        elif json_file in self.refered_jsons:
-            return self.refered_jsons[json_file]
-        else:
-            if self.base_uri:
-                #refer to remote object
-                opener = urllib2.build_opener()
-                if json_file:
-                    request = urllib2.Request(self.base_uri+'/'+json_file)
-                else:
-                    request = urllib2.Request(self.base_uri)
-                request.add_header('User-Agent','Mozilla/5.0 (Windows NT 6.1; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/37.0.2062.103 Safari/537.36')
-                resp = opener.open(request)
-                json_content = json.loads(resp.read())
-                opener.close()
-            else:
-                #refer to another local file
-                f = codecs.open(self.base_dir+'/'+json_file,'r','utf-8')
-                json_content = json.loads(f.read())
-                f.close()
-            self.refered_jsons[json_file] = json_content
-            return json_content
-
-    def __get_json_path(self,obj_key):
-        path = ''
-        for p in obj_key.split('.')[1:]:
-            if not p.isdigit():
-                path += ''.join(('[\'',p,'\']'))
-            else:
-                path += ''.join(('[',p,']'))
-        return path
-
-    def __replace_ref(self,obj_key,ref_string):
-        path = self.__get_json_path(obj_key)
-        (json_file,json_path) = ref_string.split('#')
-        real_def = extract(self.__get_refered_json(json_file),json_path)
-        exec('self.schema' + path + ' = ' + json.dumps(real_def))
-
     def merge_subschemas_under_allof(self,obj_key,all_def):
-        path = self.__get_json_path(obj_key)
         result_schema = {}
         result_schema_type = None
         for schema in all_def:
@@ -122,33 +156,46 @@ class DataProducer:
                     else:
                         pass
 
-    def __parse_object(self,obj_key,obj_def):
+    def __parse_object(self,container,slot,obj_def,document = ''):
+        '''Walk the schema, replacing each {"$ref": ...} found at container[slot] with the definition it refers to.
+        Referred definitions are walked in turn, in the context of the document holding them. A reference back to a
+        definition that is still being walked is recursive: it is kept, and expanded lazily while generating.'''
         if "$ref" in obj_def:
-            #replace the whole object with referred json
-            self.__replace_ref(obj_key,obj_def['$ref'])
-        else:
+            if id(obj_def) in self.__walking:
+                raise ValueError('Circular $ref: '+obj_def['$ref'])
+            (target,target_document) = self.resolver.resolve(obj_def['$ref'],document)
+            if id(target) in self.__walking:
+                self.__recursive.append((obj_def,target))
+                return
+            #replace the whole object with referred json, shared with the other places referring to it
+            container[slot] = target
+            self.__walking.add(id(obj_def))
+            self.__parse_object(container,slot,target,target_document)
+            self.__walking.discard(id(obj_def))
+        elif id(obj_def) not in self.__parsed:
+            self.__parsed.add(id(obj_def))
+            self.__walking.add(id(obj_def))
             if obj_def['type'] == 'object':
                 if 'definitions' in obj_def:
                     for df,value in obj_def['definitions'].items(): 
-                        self.__parse_object(obj_key+'.definitions.'+df,value)
+                        self.__parse_object(obj_def['definitions'],df,value,document)
                 for key, value in obj_def['properties'].items():
-                    self.__parse_object(obj_key+'.properties.'+key,value)
+                    self.__parse_object(obj_def['properties'],key,value,document)
             elif obj_def['type'] == 'array':
-                self.__parse_array(obj_key,obj_def)
+                self.__parse_array(obj_def,document)
             else:
                 pass
+            self.__walking.discard(id(obj_def))
 
-    def __parse_array(self,obj_key,obj_def):
+    def __parse_array(self,obj_def,document):
         if isinstance(obj_def['items'],list):
             for i in range(0,len(obj_def['items'])):
-                prop_key = obj_key+'.items.'+str(i)
-                self.__parse_object(prop_key,obj_def['items'][i])
+                self.__parse_object(obj_def['items'],i,obj_def['items'][i],document)
         else:
-            prop_key = obj_key
-            self.__parse_object(prop_key,obj_def['items'])
+            self.__parse_object(obj_def,'items',obj_def['items'],document)
 
 
-    def __build_value(self,obj_key,obj_def):
+    def __compile_value(self,obj_key,obj_def):
         if '_generator_config' not in obj_def or 'generator' not in obj_def['_generator_config']:
             if 'format' in obj_def.keys():
                 generator = self.__get_generator(obj_key, self.type_vs_generator[obj_def['format']],obj_def)
@@ -156,69 +203,66 @@ class DataProducer:
                 generator = self.__get_generator(obj_key,self.type_vs_generator[obj_def['type']],obj_def)
         else:
             generator = self.__get_generator(obj_key,obj_def['_generator_config']['generator'],obj_def)
-        return generator.generate()
-
-    def __build_array(self,obj_key,obj_def):
-        result_array = []
-        if 'minItems' in obj_def:
-            self.minLength = obj_def['minItems']
-        else:
-            self.minLength = 1
-        if 'maxItems' in obj_def:
-            self.maxLength = obj_def['maxItems']
-        else:
-            self.maxLength = 10
-        if 'uniqueItems' in obj_def:
-            self.uniqueItems = obj_def['uniqueItems']
-        else:
-            self.uniqueItems = False
+        return LeafNode(obj_key,generator)
 
+    def __compile_array(self,obj_key,obj_def):
         if isinstance(obj_def['items'],list):
+            items = []
             for i in range(0,len(obj_def['items'])):
                 prop_key = obj_key+'.'+str(i)
-                result_array.append(self.__build_object(prop_key, obj_def['items'][i]))
+                items.append(self.__compile_object(prop_key,obj_def['items'][i]))
+            return TupleNode(obj_key,items)
         else:
-            actual_number = random.randrange(self.minLength,self.maxLength+1)
-            prop_key = obj_key+'.'+obj_def['items']['type']
-            i =0 
-            while i < actual_number:
-                temp = self.__build_object(prop_key,obj_def['items'])
-                if self.uniqueItems:
-                    if temp not in result_array:
-                        result_array.append(temp)
-                        i += 1
-                    else:
-                        continue
-                else:
-                    result_array.append(temp)
-                    i += 1
-        return result_array
-
-    def __build_object(self,obj_key,obj_def):
-        if obj_key in self.generator_cache:
-            existing_generator = self.generator_cache[obj_key]
-            return existing_generator.generate()
-        else:
-            if obj_def['type'] == 'object':
-                result_object = {}
-                required = obj_def.get('required',[])
-                for key, definition in obj_def['properties'].items():
-                    to_generate = (key in required) or (random.random() > 0.5)
-                    if to_generate:
-                        prop_key = obj_key+'.'+key
-                        result_object[key] = self.__build_object(prop_key,definition)
-                return result_object
-            elif obj_def['type'] in ['string','integer','number','boolean']:
-                return self.__build_value(obj_key,obj_def)
-            elif obj_def['type'] == 'array':
-                return self.__build_array(obj_key,obj_def)
-            elif obj_def['type'] == 'null':
-                return None
+            prop_key = obj_key+'.'+obj_def['items'].get('type','$ref')
+            return ArrayNode(obj_key,
+                             self.__compile_object(prop_key,obj_def['items']),
+                             self.random,
+                             obj_def.get('minItems',1),
+                             obj_def.get('maxItems',10),
+                             obj_def.get('uniqueItems',False))
+
+    def __compile_object(self,obj_key,obj_def):
+        '''Turn a resolved schema into a tree of plan nodes with their generators attached.'''
+        node = self.__compile_definition(obj_key,obj_def)
+        if self.profiler is not None and not isinstance(node,RefNode):
+            if isinstance(node,LeafNode):
+                retry_source = node.generator if hasattr(node.generator,'retries') else None
             else:
-                raise ValueError('Unsupported value for object type: '+obj_def['type'])
+                retry_source = node if hasattr(node,'retries') else None
+            self.profiler.instrument(node,retry_source)
+        return node
+
+    def __compile_definition(self,obj_key,obj_def):
+        if '$ref' in obj_def:
+            target = self.recursive_refs[id(obj_def)]
+            return RefNode(obj_key,lambda: self.__compile_ref(obj_key,target),self.budget)
+        elif obj_def['type'] == 'object':
+            required = obj_def.get('required',[])
+            properties = []
+            for key, definition in obj_def['properties'].items():
+                prop_key = obj_key+'.'+key
+                properties.append((key,self.__compile_object(prop_key,definition),key in required))
+            return ObjectNode(obj_key,properties,self.random)
+        elif obj_def['type'] in ['string','integer','number','boolean']:
+            return self.__compile_value(obj_key,obj_def)
+        elif obj_def['type'] == 'array':
+            return self.__compile_array(obj_key,obj_def)
+        elif obj_def['type'] == 'null':
+            return NullNode(obj_key)
+        else:
+            raise ValueError('Unsupported value for object type: '+obj_def['type'])
+
+    def __compile_ref(self,obj_key,target):
+        if id(target) not in self.compiled_refs:
+            self.compiled_refs[id(target)] = self.__compile_object(obj_key,target)
+        return self.compiled_refs[id(target)]
 
     def produce(self):
-        return self.__build_object('root',self.object_defines['root'])
+        if self.thread_safe:
+            return self.__thread_producer().produce()
+        if self.recursive_refs:
+            self.budget.reset()
+        return self.plan.generate()
 
     def produce_list(self,list_length = 10):
         if not isinstance(list_length,int) or list_length <= 0:
@@ -228,13 +272,369 @@ class DataProducer:
             result_list.append(self.produce())
         return result_list
 
+    def produce_batch(self,batch_size = 10):
+        '''Produce a list of documents column-wise: every field of the plan is generated for the whole batch at once.'''
+        if not isinstance(batch_size,int) or batch_size <= 0:
+            return []
+        if self.thread_safe:
+            return self.__thread_producer().produce_batch(batch_size)
+        if self.recursive_refs:
+            self.budget.reset(batch_size)
+        return self.plan.generate_many(batch_size)
+
+    def produce_json_batch(self,batch_size = 10):
+        '''The JSON of batch_size documents, written straight from the plan without building the documents: property
+        names are encoded once when the plan is compiled, and only the values are encoded, a column at a time. Draws
+        the same random numbers as produce_batch(), so it gives the same documents, though keys may come in another order
+        than json.dumps() writes them.'''
+        if not isinstance(batch_size,int) or batch_size <= 0:
+            return []
+        if self.thread_safe:
+            return self.__thread_producer().produce_json_batch(batch_size)
+        if self.recursive_refs:
+            self.budget.reset(batch_size)
+        return self.plan.encode_many(batch_size)
+
+    def table_columns(self):
+        '''The (name, type) of the columns of produce_columns() and export_table(). See tabular.py.'''
+        from tabular import table_columns
+        return table_columns(self.plan,self.object_defines['root'])
+
+    def produce_columns(self,batch_size = 10):
+        '''batch_size documents flattened into columns, as a list of values per column in the order of table_columns().
+        The values are generated straight into the columns, drawing the same random numbers as produce_batch().'''
+        from tabular import columns_many
+        if not isinstance(batch_size,int) or batch_size <= 0:
+            return [[] for column in self.table_columns()]
+        if self.thread_safe:
+            return self.__thread_producer().produce_columns(batch_size)
+        if self.recursive_refs:
+            self.budget.reset(batch_size)
+        return columns_many(self.plan,batch_size)
+
+    def export_table(self,output,count,format = 'csv',batch_size = 10000):
+        '''Write count documents to output (a file object or a path) as a table, one column per property of the nested
+        objects. format is "csv", or "arrow" (an Arrow IPC file) or "parquet" when pyarrow is installed. Documents are
+        generated batch_size at a time, each batch being a record batch or a Parquet row group, so memory does not grow
+        with count. Returns the number of rows written.'''
+        from tabular import write_csv, write_arrow
+        if format not in ('csv','arrow','parquet'):
+            raise ValueError('Unsupported table format: '+str(format))
+        if not isinstance(count,int) or count <= 0:
+            count = 0
+        batches = (self.produce_columns(size) for size in _batch_sizes(count,batch_size))
+        if format != 'csv':
+            return write_arrow(output,self.table_columns(),batches,format)
+        if isinstance(output,basestring):
+            with io.open(output,'wb') as f:
+                return write_csv(f,self.table_columns(),batches)
+        return write_csv(output,self.table_columns(),batches)
+
+    def iter_produce(self,count = None,batch_size = 1000):
+        '''Yield documents lazily, generating batch_size of them at a time. Never stops if count is None.'''
+        remaining = count
+        while remaining is None or remaining > 0:
+            if remaining is None:
+                size = batch_size
+            else:
+                size = min(batch_size,remaining)
+                remaining -= size
+            for document in self.produce_batch(size):
+                yield document
+
+    def background(self,count = None,batch_size = 100,prefetch = 4,workers = 1):
+        '''Iterator over documents generated ahead on worker threads, at most prefetch batches of batch_size ahead
+        of the consumer. See background.BackgroundProducer.'''
+        from background import BackgroundProducer
+        return BackgroundProducer(self,count,batch_size,prefetch,workers)
+
+    def aiter(self,count = None,batch_size = 100,prefetch = 4,workers = 1,loop = None):
+        '''Asynchronous iterator over documents generated on worker threads, for coroutines of trollius (asyncio on
+        Python 2). See background.AsyncDataProducer.'''
+        from background import AsyncDataProducer
+        return AsyncDataProducer(self,count,batch_size,prefetch,workers,loop)
+
+    def stream_to(self,output,count,format = 'ndjson',batch_size = 1000):
+        '''Serialise count documents to output (a file object or a path) one batch at a time, so memory does not grow with count.
+        format is "ndjson" (one document per line) or "json" (a single array). Returns the number of documents written.'''
+        if not isinstance(count,int) or count <= 0:
+            count = 0
+        return self.__write_encoded(output,self.__encoded_batches(count,batch_size),format)
+
+    def produce_parallel(self,count,workers = None,seed = None,batch_size = 1000,output = None,format = 'ndjson'):
+        '''Produce count documents on a pool of worker processes (cpu_count() by default).
+
+        The resolved schema is shipped to each worker once. Documents are generated in shards of batch_size, and
+        shard i is seeded from (seed, i), seed being the master seed of produce_at() by default, so a given seed and
+        batch_size always give the same documents whatever the number of workers. Generators providing seek() are moved to the first document of each shard, each document
+        being given as many of their values as it can draw (see _seek()), so that the documents of different shards
+        never share the values of a StdIntegerSequence.
+        Returns the documents in order, or, when output (a file object or a path) is given, writes them there
+        like stream_to() and returns their number.'''
+        if output is not None and format not in ('ndjson','json'):
+            raise ValueError('Unsupported stream format: '+str(format))
+        if not isinstance(count,int) or count <= 0:
+            count = 0
+        if seed is None:
+            seed = self.__master_seed()
+        shards = [(_shard_seed(seed,index),index*batch_size,size,output is not None) for index,size in enumerate(_batch_sizes(count,batch_size))]
+        import multiprocessing
+        pool = multiprocessing.Pool(workers,_init_worker,(self.resolved,self.base_dir,self.type_vs_generator,self.vectorised,self.budget.max_depth,self.budget.max_expansions))
+        try:
+            results = pool.imap(_produce_shard,shards)
+            if output is None:
+                documents = []
+                for batch in results:
+                    documents.extend(batch)
+                return documents
+            return self.__write_encoded(output,results,format)
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def produce_at(self,index,seed = None):
+        '''Document index of the sequence of the master seed (the producer's seed by default), generated without the
+        documents before it: each document draws from an RNG seeded from (seed, index) only, so it is a function of the
+        schema, the seed and index, and costs the same whatever index. Generators providing seek() are moved to the
+        document first, each document being given as many of their values as it can draw (see _seek()): a
+        StdIntegerSequence drawn once per document gives start+index*step, and documents never share its values.
+        This sequence is not the one of produce(), and leaves it untouched. Custom generators not using the producer's
+        RNG cannot be seeked.'''
+        if seed is None:
+            seed = self.__master_seed()
+        producer = self.__seek_producer()
+        producer.seed(_shard_seed(seed,index))
+        _seek(producer,index)
+        if producer.recursive_refs:
+            producer.budget.reset()
+        return producer.plan.generate()
+
+    def __master_seed(self):
+        if self.master_seed is None:
+            self.master_seed = random.SystemRandom().getrandbits(64)
+        return self.master_seed
+
+    def seed(self,seed = None):
+        '''Reseed the producer's RNG, and the generators deriving an RNG of their own from it. In thread-safe mode,
+        threads then start over with new plans seeded from it. seed also becomes the master seed of produce_at() and
+        produce_parallel().'''
+        self.random.seed(seed)
+        self.master_seed = seed
+        if self.thread_safe:
+            self.generation += 1
+        for key in sorted(self.generator_cache.keys()):
+            if hasattr(self.generator_cache[key],'reseed'):
+                self.generator_cache[key].reseed()
+
+    def getstate(self):
+        '''Snapshot the producer's RNG state together with the state of generators providing getstate().
+        Restoring it with setstate() makes the producer repeat the documents produced after the snapshot.
+        In thread-safe mode, the snapshot holds the shared generators, and threads start over with new plans seeded
+        from the snapshot RNG, as after seed(): a thread deriving its plan in the same order after setstate() repeats
+        its documents. Take it while no thread is generating.'''
+        if self.thread_safe:
+            with self.__lock:
+                self.generation += 1
+                return self.__snapshot(self.shared_generators)
+        return self.__snapshot(self.generator_cache)
+
+    def setstate(self,state):
+        if self.thread_safe:
+            with self.__lock:
+                self.generation += 1
+                self.__restore(state,self.shared_generators)
+        else:
+            self.__restore(state,self.generator_cache)
+
+    def __snapshot(self,generators):
+        generator_states = {}
+        for key,generator in generators.items():
+            if hasattr(generator,'getstate'):
+                generator_states[key] = generator.getstate()
+        return (self.random.getstate(),generator_states)
+
+    def __restore(self,state,generators):
+        (random_state,generator_states) = state
+        self.random.setstate(random_state)
+        for key,generator_state in generator_states.items():
+            generators[key].setstate(generator_state)
+
+    def __encoded_batches(self,count,batch_size):
+        for size in _batch_sizes(count,batch_size):
+            yield self.produce_json_batch(size)
+
+    def __write_encoded(self,output,batches,format):
+        if format not in ('ndjson','json'):
+            raise ValueError('Unsupported stream format: '+str(format))
+        if isinstance(output,basestring):
+            with io.open(output,'wb') as f:
+                return self.__write_encoded(f,batches,format)
+        written = 0
+        if format == 'json':
+            output.write('[')
+        for batch in batches:
+            if format == 'ndjson':
+                output.write('\n'.join(batch)+'\n')
+            else:
+                chunk = ','.join(batch)
+                output.write(chunk if not written else ','+chunk)
+            written += len(batch)
+        if format == 'json':
+            output.write(']')
+        return written
 
     def __get_generator(self,obj_key, generator_name, obj_def):
         if obj_key not in self.generator_cache:
-            generator = eval(generator_name)(obj_def)
+            options = {}
+            if isinstance(generator_name,dict):
+                #a mapping entry with options: {"generator": name, "pool_size": ..., "pool_refresh": ...}
+                options = generator_name
+                generator_name = options['generator']
+            if generator_name not in self.generator_registrations:
+                self.generator_registrations[generator_name] = registry.resolve(generator_name,self.vectorised)
+            registration = self.generator_registrations[generator_name]
+            identity = self.__leaf_identity(registration,obj_def)
+            if self.shared_generators is not None and registration.thread_safe:
+                if (identity or obj_key) not in self.shared_generators:
+                    self.shared_generators.setdefault(identity or obj_key,_new_generator(registration.generator_class,obj_def,self.shared_random))
+                generator = self.shared_generators[identity or obj_key]
+            elif identity is not None:
+                if identity not in self.leaf_generators:
+                    self.leaf_generators[identity] = _new_generator(registration.generator_class,obj_def,self.random)
+                generator = self.leaf_generators[identity]
+            else:
+                generator = _new_generator(registration.generator_class,obj_def,self.random)
+            generator_config = obj_def.get('_generator_config',{})
+            pool_size = generator_config.get('pool_size',options.get('pool_size'))
+            if pool_size:
+                refresh = generator_config.get('pool_refresh',options.get('pool_refresh',POOL_REFRESH))
+                generator = PooledGenerator(generator,pool_size,refresh,self.random)
             self.generator_cache[obj_key] = generator
         return self.generator_cache[obj_key]
 
+    def __leaf_identity(self,registration,obj_def):
+        '''The key under which keys with this definition share one instance of a stateless generator: the generator and
+        the canonical JSON of the definition, annotations left out. None for the other generators.'''
+        if not registration.stateless or not _accepts_rng(registration.generator_class):
+            return None
+        identities = self.resolved.identities
+        if id(obj_def) not in identities:
+            identities[id(obj_def)] = _definition_identity(obj_def)
+        if identities[id(obj_def)] is None:
+            return None
+        return (registration.name,identities[id(obj_def)])
+
+    def __thread_producer(self):
+        '''The producer of the calling thread in thread-safe mode: a copy sharing the resolved schema and the thread-safe
+        generators, with its own plan, RNG (seeded from this producer's) and instances of the other generators.'''
+        producer = getattr(self.__local,'producer',None)
+        if producer is None or producer.generation != self.generation:
+            with self.__lock:
+                seed = self.random.getrandbits(64)
+            producer = self.__derived_producer(random.Random(seed))
+            self.__local.producer = producer
+        return producer
+
+    def __seek_producer(self):
+        '''The producer produce_at() generates with: a copy with its own plan and generators, none of them shared, all
+        drawing from its own RNG. Recursive $refs are compiled upfront, so that no generator is created, drawing from the
+        RNG, while a document is generated. In thread-safe mode, each thread has its own.'''
+        if self.thread_safe:
+            producer = getattr(self.__local,'seeker',None)
+        else:
+            producer = self.seeker
+        if producer is None:
+            producer = self.__derived_producer(random.Random(),shared = False)
+            compile_refs(producer.plan)
+            if self.thread_safe:
+                self.__local.seeker = producer
+            else:
+                self.seeker = producer
+        return producer
+
+    def __derived_producer(self,rng,shared = True):
+        '''A copy sharing the resolved schema, with its own plan, RNG and instances of the generators but the
+        thread-safe ones when shared.'''
+        producer = copy(self)
+        producer.thread_safe = False
+        producer.random = rng
+        producer.seeker = None
+        producer.generator_cache = {}
+        producer.leaf_generators = {}
+        if not shared:
+            producer.shared_generators = None
+        producer.compiled_refs = {}
+        producer.budget = ExpansionBudget(self.budget.max_depth,self.budget.max_expansions)
+        producer.plan = producer.__compile_object('root',self.object_defines['root'])
+        return producer
+
+#fraction of a value pool replaced by new values every pool_size draws, unless "pool_refresh" is given
+POOL_REFRESH = 0.1
+#keywords that do not change the values generated for a definition
+ANNOTATIONS = ('title','description','default','examples','$comment')
+_worker_producer = None
+#generator class -> whether it accepts rng
+_rng_classes = {}
+
+def _batch_sizes(count,batch_size):
+    while count > 0:
+        size = min(batch_size,count)
+        count -= size
+        yield size
+
+def _new_generator(generator_class,obj_def,rng):
+    if _accepts_rng(generator_class):
+        return generator_class(obj_def,rng = rng)
+    return generator_class(obj_def)
+
+def _definition_identity(obj_def):
+    definition = dict((key,value) for key,value in obj_def.items() if key not in ANNOTATIONS)
+    try:
+        return canonical(definition)
+    except (TypeError,ValueError):
+        return None
+
+def _accepts_rng(generator_class):
+    '''Whether the generator's __init__ takes the producer's RNG as keyword "rng". Custom generators that do not
+    keep using whatever randomness they implement themselves.'''
+    if generator_class not in _rng_classes:
+        try:
+            argspec = inspect.getargspec(generator_class.__init__)
+            _rng_classes[generator_class] = 'rng' in argspec.args or argspec.keywords is not None
+        except (TypeError,AttributeError):
+            _rng_classes[generator_class] = False
+    return _rng_classes[generator_class]
+
+def _seek(producer,index):
+    '''Move the generators of producer providing seek() to document index. A document can draw several values from a
+    generator (in arrays) or none (in optional properties): each document is given as many values as it can draw at
+    most, so that documents never share values. Raises ValueError for generators under a recursive $ref, which a
+    document can draw from any number of times.'''
+    for generator,count in draws_per_document(producer.plan).values():
+        if hasattr(generator,'seek'):
+            if count is None:
+                raise ValueError('Generators providing seek() are not supported under a recursive $ref')
+            generator.seek(index*count)
+
+def _shard_seed(seed,index):
+    '''Derive the seed of a shard from the master seed and the shard index only.'''
+    return int(hashlib.sha1('%d:%d' % (seed,index)).hexdigest()[:16],16)
+
+def _init_worker(resolved,json_file_dir,generator_mapping,vectorised,max_ref_depth,max_ref_expansions):
+    global _worker_producer
+    _worker_producer = DataProducer(resolved,json_file_dir,generator_mapping,vectorised = vectorised,max_ref_depth = max_ref_depth,max_ref_expansions = max_ref_expansions)
+    #every generator is created upfront, so that seek() reaches them all
+    compile_refs(_worker_producer.plan)
+
+def _produce_shard(shard):
+    (seed,start,size,encode) = shard
+    _worker_producer.seed(seed)
+    _seek(_worker_producer,start)
+    if encode:
+        return _worker_producer.produce_json_batch(size)
+    return _worker_producer.produce_batch(size)
+
+
 
 if __name__ == '__main__':
     sample_dir = './sample_schemas'
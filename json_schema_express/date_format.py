@@ -0,0 +1,84 @@
+'''Formatting of epoch seconds as UTC dates, with the format compiled once instead of interpreted by
+datetime.strftime() for every value.
+
+ISO 8601 shaped formats ("%Y-%m-%dT%H:%M:%SZ", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d"...) are written by datetime.isoformat().
+Other formats go through time.strftime() on the time.gmtime() tuple, which takes dates from 1900 on. Either way the
+calendar is computed by the C implementation of the datetime and time modules, which is faster than any arithmetic in
+Python, and in UTC, whatever the local timezone.'''
+
+import re
+import time
+import calendar
+from datetime import datetime, date
+from itertools import repeat
+
+#format of "date-time" strings in JSON schema
+RFC3339 = '%Y-%m-%dT%H:%M:%SZ'
+#epoch seconds of 1900-01-01, the first date time.strftime() formats
+STRFTIME_MIN = -2208988800
+
+#directives replaced by their value when a format is compiled: the timezone is UTC, rather than whatever the platform
+#writes, and the dates are whole seconds (time.strftime() does not know %f)
+FIXED_DIRECTIVES = {'z':'+0000','Z':'UTC','f':'000000'}
+
+_DIRECTIVE = re.compile('%(.)')
+#the formats isoformat() writes: the date, then the time after a one character separator, then a literal suffix
+_ISO_FORMAT = re.compile('^%Y-%m-%d(?:([^%])%H:%M:%S)?((?:[^%]|%%)*)$')
+_RFC3339_DATE = re.compile(r'^(\d{4})-(\d{2})-(\d{2})(?:[Tt ](\d{2}):(\d{2}):(\d{2})(?:\.\d+)?)?(?:[Zz]|([+-])(\d{2}):?(\d{2}))?$')
+
+
+def _compile_directive(match):
+    return FIXED_DIRECTIVES.get(match.group(1),match.group(0))
+
+
+class DateFormat(object):
+    '''A strftime format compiled to the fastest way to write it. format_many() formats a list of epoch seconds at
+    once, mapping C functions over the list.'''
+    __slots__ = ('date_format','strftime_format','iso','separator','suffix')
+
+    def __init__(self,date_format = RFC3339):
+        self.date_format = date_format
+        self.strftime_format = _DIRECTIVE.sub(_compile_directive,date_format)
+        match = _ISO_FORMAT.match(self.strftime_format)
+        self.iso = match is not None
+        if self.iso:
+            self.separator = match.group(1)
+            self.suffix = match.group(2).replace('%%','%')
+        else:
+            self.separator = self.suffix = None
+
+    def min_seconds(self):
+        '''The earliest date the format can write.'''
+        return None if self.iso else STRFTIME_MIN
+
+    def format(self,seconds):
+        return self.format_many([seconds])[0]
+
+    def format_many(self,seconds):
+        if not self.iso:
+            return map(time.strftime,repeat(self.strftime_format,len(seconds)),map(time.gmtime,seconds))
+        dates = map(datetime.utcfromtimestamp,seconds)
+        if self.separator is None:
+            texts = map(date.isoformat,map(datetime.date,dates))
+        else:
+            texts = map(datetime.isoformat,dates,repeat(self.separator,len(seconds)))
+        if self.suffix:
+            return [text+self.suffix for text in texts]
+        return texts
+
+    def parse(self,text):
+        '''The epoch seconds of text, written in this format or in RFC 3339 (a date alone is midnight UTC). A format
+        without a timezone is read as UTC.'''
+        try:
+            return calendar.timegm(datetime.strptime(text,self.strftime_format).timetuple())
+        except ValueError:
+            pass
+        match = _RFC3339_DATE.match(text)
+        if match is None:
+            raise ValueError('Date {0!r} does not match format {1!r} nor RFC 3339'.format(text,self.date_format))
+        fields = [int(field or 0) for field in match.group(1,2,3,4,5,6)]
+        seconds = calendar.timegm(fields)
+        if match.group(7):
+            offset = int(match.group(8))*3600+int(match.group(9))*60
+            seconds += -offset if match.group(7) == '+' else offset
+        return seconds
@@ -0,0 +1,165 @@
+import os
+import json
+import time
+import codecs
+import hashlib
+import urlparse
+import threading
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 6.1; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/37.0.2062.103 Safari/537.36'
+REDIRECT_CODES = (301,302,303,307,308)
+
+
+class HTTPConnectionPool(object):
+    '''Keep-alive HTTP(S) connections, one per scheme and host, reused for every request to that host.'''
+    def __init__(self,timeout = 30,max_redirects = 5):
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self.connections = {}
+        self.lock = threading.Lock()
+
+    def get(self,url,headers = None):
+        '''GET url, following redirects. Returns (status, headers with lower-cased names, body).'''
+        for i in range(0,self.max_redirects+1):
+            (status,response_headers,body) = self.__get(url,headers or {})
+            if status in REDIRECT_CODES and 'location' in response_headers:
+                url = urlparse.urljoin(url,response_headers['location'])
+            else:
+                return (status,response_headers,body)
+        raise IOError('Too many redirects when fetching '+url)
+
+    def close(self):
+        with self.lock:
+            for connection in self.connections.values():
+                connection.close()
+            self.connections = {}
+
+    def __get(self,url,headers):
+        import socket
+        import httplib
+        parts = urlparse.urlsplit(url)
+        key = (parts.scheme,parts.netloc)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?'+parts.query
+        with self.lock:
+            for attempt in (0,1):
+                if key not in self.connections:
+                    if parts.scheme == 'https':
+                        self.connections[key] = httplib.HTTPSConnection(parts.netloc,timeout = self.timeout)
+                    else:
+                        self.connections[key] = httplib.HTTPConnection(parts.netloc,timeout = self.timeout)
+                connection = self.connections[key]
+                try:
+                    connection.request('GET',path,headers = headers)
+                    response = connection.getresponse()
+                    body = response.read()
+                except (httplib.HTTPException,socket.error):
+                    #the server may have dropped an idle keep-alive connection: retry once on a new one
+                    connection.close()
+                    del self.connections[key]
+                    if attempt:
+                        raise
+                    continue
+                if response.will_close:
+                    connection.close()
+                    del self.connections[key]
+                return (response.status,dict((name.lower(),value) for name,value in response.getheaders()),body)
+
+
+class DocumentCache(object):
+    '''Cache of the documents referred to by $ref, keyed by URL or absolute file path, and shared by all producers
+    using it. An entry is served without any I/O for ttl seconds after it was last checked; after that it is
+    revalidated, with ETag/Last-Modified for URLs and mtime for files, and only downloaded or read again if it
+    changed. With cache_dir, entries are also persisted on disk so that other processes can reuse them.'''
+    def __init__(self,cache_dir = None,ttl = 300,pool = None):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.pool = pool or HTTPConnectionPool()
+        self.entries = {}
+        self.lock = threading.Lock()
+        if cache_dir and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def load(self,location):
+        '''Return the JSON document at location, a URL or a file path, freshly parsed for the caller.'''
+        return json.loads(self.read(location))
+
+    def read(self,location):
+        if '://' in location:
+            key = location
+        else:
+            key = os.path.abspath(location)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = self.__read_disk(key)
+            now = time.time()
+            if entry is None or now-entry['checked'] >= self.ttl:
+                try:
+                    entry = self.__fetch(key,entry)
+                except:
+                    self.__evict(key)
+                    raise
+                entry['checked'] = now
+                self.__write_disk(key,entry)
+            self.entries[key] = entry
+            return entry['body']
+
+    def clear(self):
+        with self.lock:
+            for key in self.entries.keys():
+                self.__evict(key)
+
+    def __fetch(self,key,entry):
+        if '://' in key:
+            headers = {'User-Agent':USER_AGENT}
+            if entry and entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry and entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+            (status,response_headers,body) = self.pool.get(key,headers)
+            if status == 304 and entry:
+                return entry
+            if status != 200:
+                raise IOError('HTTP status {0} when fetching {1}'.format(status,key))
+            return {'body':body.decode('utf-8'),'etag':response_headers.get('etag'),'last_modified':response_headers.get('last-modified')}
+        else:
+            mtime = os.path.getmtime(key)
+            if entry and entry.get('mtime') == mtime:
+                return entry
+            f = codecs.open(key,'r','utf-8')
+            body = f.read()
+            f.close()
+            return {'body':body,'mtime':mtime}
+
+    def __disk_path(self,key):
+        return os.path.join(self.cache_dir,hashlib.sha1(key.encode('utf-8')).hexdigest()+'.json')
+
+    def __read_disk(self,key):
+        if not self.cache_dir or not os.path.exists(self.__disk_path(key)):
+            return None
+        try:
+            with open(self.__disk_path(key),'rb') as f:
+                entry = json.load(f)
+        except ValueError:
+            return None
+        return entry if entry.get('location') == key else None
+
+    def __write_disk(self,key,entry):
+        if not self.cache_dir:
+            return
+        entry['location'] = key
+        path = self.__disk_path(key)
+        temp_path = '{0}.{1}.tmp'.format(path,os.getpid())
+        with open(temp_path,'wb') as f:
+            json.dump(entry,f)
+        os.rename(temp_path,path)
+
+    def __evict(self,key):
+        self.entries.pop(key,None)
+        if self.cache_dir and os.path.exists(self.__disk_path(key)):
+            os.remove(self.__disk_path(key))
+
+
+default_cache = DocumentCache()
@@ -1,21 +1,43 @@
 import random
 import sys
 import string
-import rstr
-from datetime import datetime
-from faker import Factory
+import threading
+import itertools
+import math
+import calendar
+from date_format import DateFormat, RFC3339
+from pattern import compile_pattern
+from registry import register
 
+ALPHANUMERIC = string.letters+string.digits
 
-class StdBooleanRandom:
-    def __init__(self,config):
-        random.seed()
+#largest float grid domain() enumerates
+DOMAIN_LIMIT = 100000
+
+
+@register(stateless=True)
+class StdBooleanRandom(object):
+    __slots__ = ('random',)
+
+    def __init__(self,config,rng=None):
+        self.random = rng or random.Random()
 
     def generate(self):
-        return random.choice([True,False])
+        return self.random.choice([True,False])
 
+    def generate_many(self,k):
+        rand = self.random.random
+        return [rand() < 0.5 for i in xrange(k)]
+
+    def domain(self):
+        return [True,False]
+
+@register(stateless=True)
 class StdIntegerRandom(object):
     '''Generate a random integer in given range. Support standard json keys "maximum","minimum","multipleof" and "enum" for integer.'''
-    def __init__(self,config):
+    __slots__ = ('realmin','min','max','multipleof','exclusivemin','exclusivemax','enum','retries','random','start','count')
+
+    def __init__(self,config,rng=None):
 
         self.realmin = self.min = -sys.maxint-1
         self.max = sys.maxint
@@ -23,8 +45,10 @@ class StdIntegerRandom(object):
         self.exclusivemin = False
         self.exclusivemax = False
         self.enum = []
+        #rejected draws, reported by profiling
+        self.retries = 0
 
-        random.seed()
+        self.random = rng or random.Random()
 
         if 'enum' in config.keys():
             self.enum = config['enum']
@@ -52,39 +76,97 @@ class StdIntegerRandom(object):
         if self.realmin > self.max:
             raise ValueError('Wrong range for Integer type')
 
+        #candidates are start, start+multipleof, ... (count of them), with the excluded bounds already left out
+        self.start = self.realmin
+        if self.exclusivemin and self.start == self.min:
+            self.start += self.multipleof
+        self.count = (self.max-self.start)//self.multipleof+1
+        if self.exclusivemax and self.start+(self.count-1)*self.multipleof == self.max:
+            self.count -= 1
+        if self.count <= 0 and not self.enum:
+            raise ValueError('Wrong range for Integer type')
+
     def generate(self):
         if self.enum:
-            return random.choice(self.enum)
+            return self.random.choice(self.enum)
         while True:
-            output =  random.randrange(self.realmin,self.max+1,self.multipleof)
+            output =  self.random.randrange(self.realmin,self.max+1,self.multipleof)
             if self.exclusivemax and output == self.max:
+                self.retries += 1
                 continue
             if self.exclusivemin and output == self.min:
+                self.retries += 1
                 continue
             return output
 
-class StdIntegerSequence:
-    '''Define an integer sequence with specified start and step parameters, and return one element each time generate() is called'''
+    def generate_many(self,k):
+        '''Draw k integers from the precomputed candidate range instead of rejecting excluded bounds one by one.'''
+        if self.enum:
+            choice = self.random.choice
+            return [choice(self.enum) for i in xrange(k)]
+        start = self.start
+        count = self.count
+        step = self.multipleof
+        if count < 2**53:
+            rand = self.random.random
+            return [start+step*int(rand()*count) for i in xrange(k)]
+        randrange = self.random.randrange
+        return [start+step*randrange(count) for i in xrange(k)]
+
+    def domain(self):
+        '''All the values generate() can return, as a sequence, or None if they cannot be enumerated.'''
+        if self.enum:
+            return self.enum
+        try:
+            return xrange(self.start,self.start+self.count*self.multipleof,self.multipleof)
+        except OverflowError:
+            return None
+
+@register(thread_safe=True)
+class StdIntegerSequence(object):
+    '''Define an integer sequence with specified start and step parameters, and return one element each time generate() is called.
+    Values are taken from an itertools.count, whose next() is atomic, so threads sharing the generator never get the same value.'''
+    __slots__ = ('start','step','counter')
+
     def __init__(self,config):
         self.start = config['_generator_config']['start']
         self.step = config['_generator_config']['step']
-        self.current = self.start-self.step
+        self.counter = itertools.count(self.start,self.step)
 
     def generate(self):
-        self.current +=self.step
-        return self.current
+        return next(self.counter)
 
+    def generate_many(self,k):
+        return list(itertools.islice(self.counter,k))
+
+    def seek(self,index):
+        '''Continue from the index-th value of the sequence, start+index*step, for DataProducer.produce_at() and
+        produce_parallel().'''
+        self.counter = itertools.count(self.start+index*self.step,self.step)
+
+    def getstate(self):
+        #the last value generated, from the next one the counter pickles
+        return self.counter.__reduce__()[1][0]-self.step
+
+    def setstate(self,state):
+        self.counter = itertools.count(state+self.step,self.step)
+
+@register(stateless=True)
 class StdNumberRandom(object):
     '''Generate a random float in given range. Support standard json keys "maximum","minimum","multipleof" and "enum" for float number.'''
-    def __init__(self,config):
+    __slots__ = ('min','max','multipleof','exclusivemin','exclusivemax','start','end','enum','retries','random')
+
+    def __init__(self,config,rng=None):
         self.min = 0.0
         self.max = 1000.0
         self.multipleof = 1.0
         self.exclusivemin = self.exclusivemax = False
         self.start = self.end = None
         self.enum = []
+        #rejected draws, reported by profiling
+        self.retries = 0
 
-        random.seed()
+        self.random = rng or random.Random()
 
         if 'multipleof' in config.keys():
             self.multipleof = config['multipleof']
@@ -111,31 +193,70 @@ class StdNumberRandom(object):
                 raise ValueError('Wrong range for Number(float) type.')
 
         if 'enum' in config.keys():
-            self.enum = enum
+            self.enum = config['enum']
 
     def generate(self):
         if self.enum:
-            return random.choice(self.enum)
+            return self.random.choice(self.enum)
         else:
             while True:
                 if self.multipleof == 1.0:
-                    output = random.uniform(self.min,self.max)
+                    output = self.random.uniform(self.min,self.max)
                 else:
-                    output =  self.multipleof*random.randrange(self.start,self.end)
+                    output =  self.multipleof*self.random.randrange(self.start,self.end)
                 if self.exclusivemax and output == self.max:
+                    self.retries += 1
                     continue
                 if self.exclusivemin and output == self.min:
+                    self.retries += 1
                     continue
                 return output
 
+    def generate_many(self,k):
+        if self.enum:
+            choice = self.random.choice
+            return [choice(self.enum) for i in xrange(k)]
+        rand = self.random.random
+        if self.multipleof == 1.0:
+            low = self.min
+            width = self.max-self.min
+            values = [low+width*rand() for i in xrange(k)]
+        else:
+            multipleof = self.multipleof
+            start = self.start
+            count = self.end-self.start
+            values = [multipleof*(start+int(rand()*count)) for i in xrange(k)]
+        if self.exclusivemin or self.exclusivemax:
+            #bound hits are rare, so only the offending values are redrawn
+            for i in xrange(k):
+                if (self.exclusivemax and values[i] == self.max) or (self.exclusivemin and values[i] == self.min):
+                    self.retries += 1
+                    values[i] = self.generate()
+        return values
+
+    def domain(self):
+        '''The enum, or the multiples of multipleof in range when there are at most DOMAIN_LIMIT of them. Other floats
+        cannot be enumerated.'''
+        if self.enum:
+            return self.enum
+        if self.multipleof == 1.0 or self.end-self.start > DOMAIN_LIMIT:
+            return None
+        values = [self.multipleof*i for i in xrange(self.start,self.end)]
+        return [value for value in values if not ((self.exclusivemax and value == self.max) or (self.exclusivemin and value == self.min))]
+
+@register(stateless=True)
 class StdStringRandom(object):
-    def __init__(self,config,minLength=1,maxLength=10):
+    __slots__ = ('minLength','maxLength','pattern','sampler','enum','random','rstr')
+
+    def __init__(self,config,minLength=1,maxLength=10,rng=None):
         self.minLength = minLength
         self.maxLength = maxLength
         self.pattern = None
+        self.sampler = None
         self.enum = []
 
-        random.seed()
+        self.random = rng or random.Random()
+        self.rstr = None
 
         if 'minLength' in config.keys():
             if not isinstance(self.minLength,int):
@@ -150,70 +271,291 @@ class StdStringRandom(object):
 
         if 'pattern' in config.keys():
             self.pattern = config['pattern']
+            #minLength/maxLength only constrain a pattern when they are given explicitly
+            self.sampler = compile_pattern(self.pattern,self.random,config.get('minLength'),config.get('maxLength'))
 
         if 'enum' in config.keys():
             self.enum = config['enum']
 
     def generate(self):
         if self.enum:
-            return random.choice(self.enum)
+            return self.random.choice(self.enum)
+        elif self.sampler:
+            return self.sampler.sample()
         elif self.pattern:
-            return rstr.xeger(self.pattern)
+            return self.__rstr().xeger(self.pattern)
         else:
-            return rstr.rstr(string.letters+string.digits,self.minLength,self.maxLength)
+            choice = self.random.choice
+            return ''.join([choice(ALPHANUMERIC) for i in xrange(self.random.randint(self.minLength,self.maxLength))])
 
-class StdDateTimeRandom:
-    def __init__(self,config):
-
-        if 'date_format' in config['_generator_config']:
-            self.date_format = config['_generator_config']['date_format']
-        else:
-            self.date_format = '%Y-%m-%d %H:%M:%S'
-        if 'from' in config['_generator_config']:
-            self.from_long = int((datetime.strptime(config['_generator_config']['from'],self.date_format)-datetime(1970,1,1)).total_seconds())
+    def generate_many(self,k):
+        choice = self.random.choice
+        if self.enum:
+            return [choice(self.enum) for i in xrange(k)]
+        elif self.sampler:
+            return self.sampler.sample_many(k)
+        elif self.pattern:
+            xeger = self.__rstr().xeger
+            return [xeger(self.pattern) for i in xrange(k)]
+        randint = self.random.randint
+        return [''.join([choice(ALPHANUMERIC) for j in xrange(randint(self.minLength,self.maxLength))]) for i in xrange(k)]
+
+    def domain(self):
+        return self.enum or None
+
+    def __rstr(self):
+        '''rstr, imported on first use: only the patterns the sampler does not handle need it.'''
+        if self.rstr is None:
+            import rstr
+            self.rstr = rstr.Rstr(self.random)
+        return self.rstr
+
+@register(stateless=True)
+class StdDateTimeRandom(object):
+    '''Generate a random date from "from" to "to" (1970-01-01 to 2500-01-01 by default) in UTC, written in "date_format",
+    RFC 3339 by default. "from", "to" and "mean" are written in date_format or in RFC 3339. Dates are drawn with
+    "distribution": "uniform" (the default), "normal" around "mean" (the middle of the range by default) with a
+    standard deviation of "stddev" seconds (a sixth of the range by default), or "exponential" after "from" with a
+    mean of "scale" seconds (a tenth of the range by default). Both are truncated to the range, and sampled by
+    inverting their distribution function, so that no draw is ever rejected.'''
+    __slots__ = ('date_format','formatter','from_long','to_long','distribution','mean','stddev','scale','random')
+
+    def __init__(self,config,rng=None):
+        generator_config = config.get('_generator_config',{})
+        self.date_format = generator_config.get('date_format',RFC3339)
+        self.formatter = DateFormat(self.date_format)
+        if 'from' in generator_config:
+            self.from_long = self.formatter.parse(generator_config['from'])
         else:
             self.from_long = 0
-        if 'to' in config['_generator_config']:
-            self.to_long = int((datetime.strptime(config['_generator_config']['to'],self.date_format)-datetime(1970,1,1)).total_seconds())
+        if 'to' in generator_config:
+            self.to_long = self.formatter.parse(generator_config['to'])
         else:
-            self.to_long = int((datetime(2500,1,1)-datetime(1970,1,1)).total_seconds())
-        random.seed()
-
-    def generate(self):
-        seconds = random.randint(self.from_long,self.to_long)
-        return datetime.fromtimestamp(seconds).strftime(self.date_format)
-
-class StdDomainNameRandom(object):
-    def __init__(self,config):
-        self.factory = Factory.create()
-
-    def generate(self):
-        return self.factory.domain_name()
-
-class StdEmailRandom(object):
-    def __init__(self,config):
-        self.factory = Factory.create()
-
-    def generate(self):
-        return self.factory.email()
-
-class StdIPv4Random(object):
-    def __init__(self,config):
-        self.factory = Factory.create()
+            self.to_long = calendar.timegm((2500,1,1,0,0,0))
+        if self.from_long > self.to_long:
+            raise ValueError('Wrong range for DateTime type')
+        if self.formatter.min_seconds() is not None and self.from_long < self.formatter.min_seconds():
+            raise ValueError('date_format {0!r} can only write dates from 1900 on'.format(self.date_format))
+
+        span = self.to_long-self.from_long
+        self.distribution = generator_config.get('distribution','uniform')
+        if self.distribution not in ('uniform','normal','exponential'):
+            raise ValueError('Unknown distribution for DateTime type: '+str(self.distribution))
+        if 'mean' in generator_config:
+            self.mean = self.formatter.parse(generator_config['mean'])
+        else:
+            self.mean = self.from_long+span/2.0
+        self.stddev = float(generator_config.get('stddev',span/6.0))
+        self.scale = float(generator_config.get('scale',span/10.0))
+        if not self.from_long <= self.mean <= self.to_long:
+            raise ValueError('mean of DateTime type should be within from/to')
+        if self.stddev < 0 or self.scale < 0:
+            raise ValueError('stddev and scale of DateTime type should not be negative')
+        self.random = rng or random.Random()
 
     def generate(self):
-        return self.factory.ipv4()
-
-class StdIPv6Random(object):
-    def __init__(self,config):
-        self.factory = Factory.create()
+        return self.formatter.format(self.draw_many(1)[0])
+
+    def generate_many(self,k):
+        '''Draw k epoch seconds, then format them all at once.'''
+        return self.formatter.format_many(self.draw_many(k))
+
+    def draw_many(self,k):
+        low = self.from_long
+        high = self.to_long
+        if self.distribution == 'uniform':
+            count = high-low+1
+            if count < 2**53:
+                rand = self.random.random
+                return [low+int(rand()*count) for i in xrange(k)]
+            randint = self.random.randint
+            return [randint(low,high) for i in xrange(k)]
+        rand = self.random.random
+        if self.distribution == 'normal':
+            if not self.stddev:
+                return [int(round(self.mean))]*k
+            #uniform draws between the distribution function at from and at to, mapped back through its inverse
+            mean = self.mean
+            stddev = self.stddev
+            cdf_low = _normal_cdf((low-mean)/stddev)
+            width = _normal_cdf((high-mean)/stddev)-cdf_low
+            values = [int(round(mean+stddev*_normal_quantile(cdf_low+rand()*width))) for i in xrange(k)]
+        else:
+            if not self.scale:
+                return [low]*k
+            scale = self.scale
+            #probability of the exponential distribution to fall within the range
+            mass = -math.expm1(-(high-low)/scale)
+            log1p = math.log1p
+            values = [low+int(-scale*log1p(-rand()*mass)) for i in xrange(k)]
+        #rounding errors only
+        return [min(max(value,low),high) for value in values]
+
+#coefficients of the rational approximations of the normal quantile function by P. J. Acklam
+_QUANTILE_A = (-3.969683028665376e+01,2.209460984245205e+02,-2.759285104469687e+02,1.383577518672690e+02,-3.066479806614716e+01,2.506628277459239e+00)
+_QUANTILE_B = (-5.447609879822406e+01,1.615858368580409e+02,-1.556989798598866e+02,6.680131188771972e+01,-1.328068155288572e+01)
+_QUANTILE_C = (-7.784894002430293e-03,-3.223964580411365e-01,-2.400758277161838e+00,-2.549732539343734e+00,4.374664141464968e+00,2.938163982698783e+00)
+_QUANTILE_D = (7.784695709041462e-03,3.224671290700398e-01,2.445134137142996e+00,3.754408661907416e+00)
+
+def _normal_cdf(x):
+    return 0.5*math.erfc(-x/math.sqrt(2))
+
+def _normal_quantile(p):
+    '''The x at which the standard normal distribution function is p: Acklam's approximation, refined by one step of
+    Halley's method to full double precision.'''
+    p = min(max(p,1e-300),1-2**-53)
+    (a,b,c,d) = (_QUANTILE_A,_QUANTILE_B,_QUANTILE_C,_QUANTILE_D)
+    if p < 0.02425 or p > 0.97575:
+        q = math.sqrt(-2*math.log(min(p,1-p)))
+        x = (((((c[0]*q+c[1])*q+c[2])*q+c[3])*q+c[4])*q+c[5])/((((d[0]*q+d[1])*q+d[2])*q+d[3])*q+1)
+        if p > 0.5:
+            x = -x
+    else:
+        q = p-0.5
+        r = q*q
+        x = (((((a[0]*r+a[1])*r+a[2])*r+a[3])*r+a[4])*r+a[5])*q/(((((b[0]*r+b[1])*r+b[2])*r+b[3])*r+b[4])*r+1)
+    e = _normal_cdf(x)-p
+    u = e*math.sqrt(2*math.pi)*math.exp(x*x/2)
+    return x-u/(1+x*u/2)
+
+class ThreadRandom(object):
+    '''Stands in for the random.Random of a shared Faker, delegating to the RNG selected with use() by the calling thread.'''
+    __slots__ = ('local',)
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def use(self,rng):
+        self.local.rng = rng
+
+    def __getattr__(self,name):
+        return getattr(self.local.rng,name)
+
+_fakers = {}
+_fakers_lock = threading.Lock()
+
+def shared_faker(locale=None):
+    '''The process-wide Faker for locale, created on first use and shared by all format generators.'''
+    with _fakers_lock:
+        if locale not in _fakers:
+            from faker import Factory
+            factory = Factory.create(locale)
+            factory.random = ThreadRandom()
+            _fakers[locale] = factory
+        return _fakers[locale]
+
+class FakerRandom(object):
+    '''Base of the format generators, which draw values from the shared Faker of "locale" in _generator_config using
+    their own RNG.'''
+    faker_method = None
+    __slots__ = ('random','locale','factory')
+
+    def __init__(self,config,rng=None):
+        generator_config = config.get('_generator_config',{})
+        self.random = rng or random.Random()
+        self.locale = generator_config.get('locale')
+        self.factory = None
 
     def generate(self):
-        return self.factory.ipv6()
-
-class StdURIRandom(object):
-    def __init__(self,config):
-        self.factory = Factory.create()
+        return self.generate_many(1)[0]
+
+    def generate_many(self,k):
+        if self.factory is None:
+            self.factory = shared_faker(self.locale)
+        self.factory.random.use(self.random)
+        fake = getattr(self.factory,self.faker_method)
+        return [fake() for i in xrange(k)]
+
+@register(stateless=True)
+class StdDomainNameRandom(FakerRandom):
+    faker_method = 'domain_name'
+    __slots__ = ()
+
+@register(stateless=True)
+class StdEmailRandom(FakerRandom):
+    faker_method = 'email'
+    __slots__ = ()
+
+@register(stateless=True)
+class StdIPv4Random(FakerRandom):
+    faker_method = 'ipv4'
+    __slots__ = ()
+
+@register(stateless=True)
+class StdIPv6Random(FakerRandom):
+    faker_method = 'ipv6'
+    __slots__ = ()
+
+@register(stateless=True)
+class StdURIRandom(FakerRandom):
+    faker_method = 'uri'
+    __slots__ = ()
+
+class PooledGenerator(object):
+    '''Serves the values of generator from a pool of pool_size values generated in bulk, drawing one of them at random
+    on each call. Every pool_size draws, the refresh fraction of the pool is replaced by new values: the pool keeps
+    following the generator's distribution while only that fraction of the values served is generated. Values are
+    served several times, so only generators of immutable values (strings, numbers...) should be pooled.'''
+    __slots__ = ('generator','random','pool_size','refresh','pool','remaining')
+
+    def __init__(self,generator,pool_size,refresh=0.1,rng=None):
+        if not isinstance(pool_size,int) or pool_size < 1:
+            raise ValueError('pool_size should be a positive integer')
+        if not 0 < refresh <= 1:
+            raise ValueError('pool_refresh should be in (0, 1]')
+        self.generator = generator
+        self.random = rng or random.Random()
+        self.pool_size = pool_size
+        #values replaced on each refresh
+        self.refresh = max(1,int(round(pool_size*refresh)))
+        self.pool = []
+        self.remaining = 0
 
     def generate(self):
-        return self.factory.uri()
\ No newline at end of file
+        if not self.remaining:
+            self.__refresh()
+        self.remaining -= 1
+        return self.pool[int(self.random.random()*self.pool_size)]
+
+    def generate_many(self,k):
+        rand = self.random.random
+        values = []
+        while len(values) < k:
+            if not self.remaining:
+                self.__refresh()
+            count = min(k-len(values),self.remaining)
+            pool = self.pool
+            size = self.pool_size
+            values.extend([pool[int(rand()*size)] for i in xrange(count)])
+            self.remaining -= count
+        return values
+
+    def __refresh(self):
+        if not self.pool:
+            self.pool = self.__draw(self.pool_size)
+        else:
+            indexes = self.random.sample(xrange(self.pool_size),self.refresh)
+            for index,value in zip(indexes,self.__draw(self.refresh)):
+                self.pool[index] = value
+        self.remaining = self.pool_size
+
+    def __draw(self,k):
+        if hasattr(self.generator,'generate_many'):
+            return self.generator.generate_many(k)
+        return [self.generator.generate() for i in xrange(k)]
+
+    def reseed(self):
+        self.pool = []
+        self.remaining = 0
+        if hasattr(self.generator,'reseed'):
+            self.generator.reseed()
+
+    def getstate(self):
+        state = self.generator.getstate() if hasattr(self.generator,'getstate') else None
+        return (list(self.pool),self.remaining,state)
+
+    def setstate(self,state):
+        self.pool = list(state[0])
+        self.remaining = state[1]
+        if state[2] is not None:
+            self.generator.setstate(state[2])
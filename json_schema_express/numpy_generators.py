@@ -0,0 +1,134 @@
+from generators import StdBooleanRandom, StdIntegerRandom, StdNumberRandom
+from registry import register
+
+__all__ = ['NumpyBooleanRandom','NumpyIntegerRandom','NumpyNumberRandom']
+
+INT64_MIN = -2**63
+INT64_MAX = 2**63-1
+UINT64_MASK = 2**64-1
+
+
+def _import_numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError('The Numpy* generators require numpy to be installed.')
+    return numpy
+
+
+class NumpyRandomMixin(object):
+    '''Shared plumbing of the numpy generators: a numpy RNG, whole-array draws in generate_many() and a buffer
+    of pre-drawn values consumed by generate().'''
+    __slots__ = ()
+    buffer_size = 1024
+
+    def _init_numpy(self):
+        self.numpy = _import_numpy()
+        self.reseed()
+
+    def reseed(self):
+        '''Start a new numpy RNG seeded from the generator's random.Random, dropping buffered values.'''
+        seed = self.random.getrandbits(32)
+        if hasattr(self.numpy.random,'default_rng'):
+            self.rng = self.numpy.random.default_rng(seed)
+            self.random_floats = self.rng.random
+            self.random_integers = self.rng.integers
+        else:
+            #numpy < 1.17 has no numpy.random.Generator
+            self.rng = self.numpy.random.RandomState(seed)
+            self.random_floats = self.rng.random_sample
+            self.random_integers = self.rng.randint
+        self.buffer = []
+
+    def getstate(self):
+        return (self.rng.get_state() if hasattr(self.rng,'get_state') else self.rng.bit_generator.state,list(self.buffer))
+
+    def setstate(self,state):
+        if hasattr(self.rng,'set_state'):
+            self.rng.set_state(state[0])
+        else:
+            self.rng.bit_generator.state = state[0]
+        self.buffer = list(state[1])
+
+    def generate(self):
+        if not self.buffer:
+            self.buffer = self.generate_many(self.buffer_size)
+            self.buffer.reverse()
+        return self.buffer.pop()
+
+    def _choose(self,values,k):
+        indexes = self.random_integers(0,len(values),size=k)
+        return self.numpy.asarray(values,dtype=object)[indexes].tolist()
+
+
+@register(vectorised=True,alternative_to='StdBooleanRandom',requires=('numpy',))
+class NumpyBooleanRandom(NumpyRandomMixin,StdBooleanRandom):
+    '''Vectorised counterpart of StdBooleanRandom.'''
+    __slots__ = ('numpy','rng','random_floats','random_integers','buffer')
+
+    def __init__(self,config,rng=None):
+        StdBooleanRandom.__init__(self,config,rng=rng)
+        self._init_numpy()
+
+    def generate_many(self,k):
+        return (self.random_floats(k) < 0.5).tolist()
+
+
+@register(vectorised=True,alternative_to='StdIntegerRandom',requires=('numpy',))
+class NumpyIntegerRandom(NumpyRandomMixin,StdIntegerRandom):
+    '''Vectorised counterpart of StdIntegerRandom. Accepts the same keywords; values are drawn as whole uint64 arrays
+    of candidate indexes, so excluded bounds never have to be rejected.'''
+    __slots__ = ('numpy','rng','random_floats','random_integers','buffer','vectorised')
+
+    def __init__(self,config,rng=None):
+        StdIntegerRandom.__init__(self,config,rng=rng)
+        self._init_numpy()
+        last = self.start+(self.count-1)*self.multipleof
+        #int64 arithmetic wraps modulo 2**64, which is exact as long as every candidate fits in int64
+        self.vectorised = INT64_MIN <= self.start and last <= INT64_MAX
+
+    def generate_many(self,k):
+        if self.enum:
+            return self._choose(self.enum,k)
+        if not self.vectorised:
+            return StdIntegerRandom.generate_many(self,k)
+        numpy = self.numpy
+        indexes = self.random_integers(0,self.count,size=k,dtype=numpy.uint64)
+        values = numpy.uint64(self.start & UINT64_MASK)+indexes*numpy.uint64(self.multipleof)
+        return values.view(numpy.int64).tolist()
+
+
+@register(vectorised=True,alternative_to='StdNumberRandom',requires=('numpy',))
+class NumpyNumberRandom(NumpyRandomMixin,StdNumberRandom):
+    '''Vectorised counterpart of StdNumberRandom. Values that hit an exclusive bound are masked and redrawn as a
+    (much smaller) array until none is left.'''
+    __slots__ = ('numpy','rng','random_floats','random_integers','buffer')
+
+    def __init__(self,config,rng=None):
+        StdNumberRandom.__init__(self,config,rng=rng)
+        self._init_numpy()
+
+    def _draw(self,k):
+        if self.multipleof == 1.0:
+            return self.min+(self.max-self.min)*self.random_floats(k)
+        return self.multipleof*self.random_integers(self.start,self.end,size=k)
+
+    def _excluded(self,values):
+        mask = self.numpy.zeros(len(values),dtype=bool)
+        if self.exclusivemin:
+            mask |= values == self.min
+        if self.exclusivemax:
+            mask |= values == self.max
+        return mask
+
+    def generate_many(self,k):
+        if self.enum:
+            return self._choose(self.enum,k)
+        values = self._draw(k)
+        if self.exclusivemin or self.exclusivemax:
+            rejected = self.numpy.flatnonzero(self._excluded(values))
+            while len(rejected):
+                self.retries += len(rejected)
+                values[rejected] = self._draw(len(rejected))
+                rejected = rejected[self._excluded(values[rejected])]
+        return values.tolist()
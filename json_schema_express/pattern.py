@@ -0,0 +1,385 @@
+import string
+import sre_parse
+import sre_constants as sre
+
+#repeats generated at most for the unbounded quantifiers *, + and {n,}, as rstr does
+STAR_PLUS_LIMIT = 100
+
+#alphabets of the character classes, as in rstr
+PRINTABLE = string.printable
+CATEGORIES = {
+    sre.CATEGORY_DIGIT: string.digits,
+    sre.CATEGORY_NOT_DIGIT: string.ascii_letters+string.punctuation,
+    sre.CATEGORY_SPACE: string.whitespace,
+    sre.CATEGORY_NOT_SPACE: string.printable.strip(),
+    sre.CATEGORY_WORD: string.ascii_letters+string.digits+'_',
+    sre.CATEGORY_NOT_WORD: ''.join(sorted(set(string.printable)-set(string.ascii_letters+string.digits+'_'))),
+}
+
+#The length sets below are ints used as bit sets: bit n is set if the node can generate a string of length n.
+
+
+def _lengths(bits):
+    '''The lengths in a length set, in increasing order.'''
+    lengths = []
+    while bits:
+        low = bits & -bits
+        lengths.append(low.bit_length()-1)
+        bits ^= low
+    return lengths
+
+
+def _fixed(bits):
+    '''The only length in a length set, or None.'''
+    if bits and not bits & (bits-1):
+        return bits.bit_length()-1
+    return None
+
+
+def _truncate(bits,limit):
+    if limit is None:
+        return bits
+    return bits & ((2 << limit)-1)
+
+
+def _add(a,b,limit):
+    '''Length set of the concatenation of strings of length sets a and b.'''
+    if _fixed(a) is not None:
+        return _truncate(b << _fixed(a),limit)
+    result = 0
+    for length in _lengths(a):
+        if limit is not None and length > limit:
+            break
+        result |= b << length
+    return _truncate(result,limit)
+
+
+class UnsupportedPattern(Exception):
+    pass
+
+
+class LiteralNode(object):
+    __slots__ = ('text','lengths','fixed')
+
+    def __init__(self,text):
+        self.text = text
+        self.lengths = 1 << len(text)
+        self.fixed = len(text)
+
+    def emit(self,out,n):
+        out.append(self.text)
+
+    def draw(self,count):
+        return self.text*count
+
+
+class CharsNode(object):
+    '''One character out of chars.'''
+    __slots__ = ('chars','size','random','lengths','fixed')
+
+    def __init__(self,chars,rng):
+        self.chars = chars
+        self.size = len(chars)
+        self.random = rng
+        self.lengths = 2 if chars else 0
+        self.fixed = 1 if chars else None
+
+    def emit(self,out,n):
+        out.append(self.chars[int(self.random.random()*self.size)])
+
+    def draw(self,count):
+        chars = self.chars
+        size = self.size
+        rand = self.random.random
+        return ''.join([chars[int(rand()*size)] for i in xrange(count)])
+
+
+class SequenceNode(object):
+    __slots__ = ('items','random','suffixes','lengths','fixed','all_fixed','splits')
+
+    def __init__(self,items,rng,limit):
+        self.items = items
+        self.random = rng
+        #suffixes[i] is the length set of items[i:]
+        self.suffixes = [1]
+        for item in reversed(items):
+            self.suffixes.append(_add(item.lengths,self.suffixes[-1],limit))
+        self.suffixes.reverse()
+        self.lengths = self.suffixes[0]
+        self.fixed = _fixed(self.lengths)
+        self.all_fixed = all(item.fixed is not None for item in items)
+        self.splits = [{} for item in items]
+
+    def emit(self,out,n):
+        if self.all_fixed:
+            for item in self.items:
+                item.emit(out,item.fixed)
+            return
+        choice = self.random.choice
+        for i,item in enumerate(self.items):
+            if item.fixed is not None:
+                length = item.fixed
+            else:
+                if n not in self.splits[i]:
+                    rest = self.suffixes[i+1]
+                    self.splits[i][n] = [length for length in _lengths(item.lengths) if length <= n and rest >> (n-length) & 1]
+                length = choice(self.splits[i][n])
+            item.emit(out,length)
+            n -= length
+
+
+class BranchNode(object):
+    __slots__ = ('alternatives','random','lengths','fixed','candidates')
+
+    def __init__(self,alternatives,rng):
+        self.alternatives = alternatives
+        self.random = rng
+        self.lengths = 0
+        for alternative in alternatives:
+            self.lengths |= alternative.lengths
+        self.fixed = _fixed(self.lengths)
+        self.candidates = {}
+
+    def emit(self,out,n):
+        if n not in self.candidates:
+            self.candidates[n] = [alternative for alternative in self.alternatives if alternative.lengths >> n & 1]
+        self.random.choice(self.candidates[n]).emit(out,n)
+
+
+class RepeatNode(object):
+    __slots__ = ('item','min_count','random','counts','splits','powers','lengths','item_lengths','fixed')
+
+    def __init__(self,item,min_count,max_count,rng,limit):
+        self.item = item
+        self.min_count = min_count
+        self.random = rng
+        self.counts = {}
+        self.splits = {}
+        if item.fixed is not None:
+            self.powers = None
+            if item.fixed == 0:
+                self.lengths = 1
+            else:
+                if limit is not None:
+                    max_count = min(max_count,limit//item.fixed)
+                if max_count < min_count:
+                    self.lengths = 0
+                else:
+                    #bits item.fixed apart, from min_count*item.fixed to max_count*item.fixed
+                    step = 1 << item.fixed
+                    self.lengths = ((step**(max_count-min_count+1)-1)//(step-1)) << (min_count*item.fixed)
+        else:
+            #powers[c] is the length set of c repetitions
+            self.powers = [1]
+            while len(self.powers) <= max_count:
+                power = _add(self.powers[-1],item.lengths,limit)
+                if not power:
+                    break
+                self.powers.append(power)
+            self.lengths = 0
+            for power in self.powers[min_count:]:
+                self.lengths |= power
+            self.item_lengths = _lengths(item.lengths)
+        self.fixed = _fixed(self.lengths)
+
+    def emit(self,out,n):
+        item = self.item
+        if self.powers is None:
+            count = n//item.fixed if item.fixed else self.min_count
+            if hasattr(item,'draw'):
+                out.append(item.draw(count))
+            else:
+                for i in xrange(count):
+                    item.emit(out,item.fixed)
+            return
+        choice = self.random.choice
+        powers = self.powers
+        if n not in self.counts:
+            self.counts[n] = [count for count in xrange(self.min_count,len(powers)) if powers[count] >> n & 1]
+        count = choice(self.counts[n])
+        for left in xrange(count-1,-1,-1):
+            if (left,n) not in self.splits:
+                self.splits[(left,n)] = [length for length in self.item_lengths if length <= n and powers[left] >> (n-length) & 1]
+            length = choice(self.splits[(left,n)])
+            item.emit(out,length)
+            n -= length
+
+
+class GroupNode(object):
+    '''A group referred to by a backreference: its text is kept for the reference.'''
+    __slots__ = ('item','index','groups','lengths','fixed')
+
+    def __init__(self,item,index,groups):
+        self.item = item
+        self.index = index
+        self.groups = groups
+        self.lengths = item.lengths
+        self.fixed = item.fixed
+
+    def emit(self,out,n):
+        text = []
+        self.item.emit(text,n)
+        self.groups[self.index] = ''.join(text)
+        out.append(self.groups[self.index])
+
+
+class GroupRefNode(object):
+    __slots__ = ('index','groups','lengths','fixed')
+
+    def __init__(self,group):
+        if group.fixed is None:
+            raise UnsupportedPattern('backreference to a group of variable length')
+        self.index = group.index
+        self.groups = group.groups
+        self.lengths = group.lengths
+        self.fixed = group.fixed
+
+    def emit(self,out,n):
+        out.append(self.groups.get(self.index,''))
+
+
+class PatternSampler(object):
+    '''Generate strings matching a regular expression, parsed once into a tree of nodes. Every node knows the set
+    of lengths it can generate, so strings are sampled directly with a length within min_length and max_length:
+    the total length is drawn first, then split between the nodes.'''
+    __slots__ = ('random','limit','groups','group_nodes','referenced','root','lengths','template')
+
+    def __init__(self,pattern,rng,min_length = None,max_length = None):
+        self.random = rng
+        self.limit = max_length
+        self.groups = {}
+        self.group_nodes = {}
+        parsed = sre_parse.parse(pattern)
+        self.referenced = self.__referenced_groups(parsed)
+        self.root = self.__compile(parsed)
+        lengths = _truncate(self.root.lengths,max_length)
+        if min_length:
+            lengths &= ~((1 << min_length)-1)
+        if not lengths:
+            raise ValueError('Pattern {0} cannot match a string of length {1} to {2}'.format(pattern,min_length or 0,max_length))
+        self.lengths = _lengths(lengths)
+        self.template = self.__template(self.root) if self.root.fixed is not None else None
+
+    def sample(self):
+        if self.template is not None:
+            return self.__sample_template()
+        lengths = self.lengths
+        out = []
+        self.root.emit(out,lengths[int(self.random.random()*len(lengths))])
+        return ''.join(out)
+
+    def sample_many(self,k):
+        if self.template is not None:
+            sample = self.__sample_template
+        else:
+            sample = self.sample
+        return [sample() for i in xrange(k)]
+
+    def __sample_template(self):
+        rand = self.random.random
+        return ''.join([chars[int(rand()*size)] if size else chars for chars,size in self.template])
+
+    def __template(self,node):
+        '''Flatten a pattern of fixed length without groups into (chars, size) pairs, size 0 for literal text.'''
+        if node.fixed is None:
+            return None
+        elif isinstance(node,LiteralNode):
+            return [(node.text,0)]
+        elif isinstance(node,CharsNode):
+            return [(node.chars,node.size)]
+        elif isinstance(node,SequenceNode):
+            template = []
+            for item in node.items:
+                item_template = self.__template(item)
+                if item_template is None:
+                    return None
+                template.extend(item_template)
+            return template
+        elif isinstance(node,RepeatNode) and node.powers is None and node.item.fixed:
+            item_template = self.__template(node.item)
+            if item_template is None:
+                return None
+            return item_template*(node.fixed//node.item.fixed)
+        return None
+
+    def __referenced_groups(self,parsed):
+        referenced = set()
+        for opcode,value in parsed:
+            if opcode == sre.GROUPREF:
+                referenced.add(value)
+            elif opcode == sre.SUBPATTERN:
+                referenced |= self.__referenced_groups(value[-1])
+            elif opcode == sre.BRANCH:
+                for alternative in value[1]:
+                    referenced |= self.__referenced_groups(alternative)
+            elif opcode in (sre.MAX_REPEAT,sre.MIN_REPEAT):
+                referenced |= self.__referenced_groups(value[2])
+        return referenced
+
+    def __compile(self,parsed):
+        items = []
+        for opcode,value in parsed:
+            node = self.__compile_state(opcode,value)
+            if isinstance(node,LiteralNode) and items and isinstance(items[-1],LiteralNode):
+                items[-1] = LiteralNode(items[-1].text+node.text)
+            else:
+                items.append(node)
+        if not items:
+            return LiteralNode('')
+        elif len(items) == 1:
+            return items[0]
+        return SequenceNode(items,self.random,self.limit)
+
+    def __compile_state(self,opcode,value):
+        if opcode == sre.LITERAL:
+            return LiteralNode(unichr(value))
+        elif opcode == sre.NOT_LITERAL:
+            return CharsNode(''.join(sorted(set(PRINTABLE)-set(unichr(value)))),self.random)
+        elif opcode == sre.ANY:
+            return CharsNode(PRINTABLE.replace('\n',''),self.random)
+        elif opcode == sre.IN:
+            return CharsNode(self.__charset(value),self.random)
+        elif opcode == sre.AT:
+            return LiteralNode('')
+        elif opcode == sre.BRANCH:
+            return BranchNode([self.__compile(alternative) for alternative in value[1]],self.random)
+        elif opcode == sre.SUBPATTERN:
+            node = self.__compile(value[-1])
+            if value[0] in self.referenced:
+                node = self.group_nodes[value[0]] = GroupNode(node,value[0],self.groups)
+            return node
+        elif opcode in (sre.MAX_REPEAT,sre.MIN_REPEAT):
+            (min_count,max_count,item) = value
+            if max_count == sre.MAXREPEAT:
+                max_count = max(min_count,STAR_PLUS_LIMIT)
+            return RepeatNode(self.__compile(item),min_count,max_count,self.random,self.limit)
+        elif opcode == sre.GROUPREF and value in self.group_nodes:
+            return GroupRefNode(self.group_nodes[value])
+        raise UnsupportedPattern(str(opcode))
+
+    def __charset(self,items):
+        chars = set()
+        negate = False
+        for opcode,value in items:
+            if opcode == sre.NEGATE:
+                negate = True
+            elif opcode == sre.LITERAL:
+                chars.add(unichr(value))
+            elif opcode == sre.RANGE:
+                chars.update(unichr(code) for code in xrange(value[0],value[1]+1))
+            elif opcode == sre.CATEGORY and value in CATEGORIES:
+                chars.update(CATEGORIES[value])
+            else:
+                raise UnsupportedPattern(str(opcode))
+        if negate:
+            chars = set(PRINTABLE)-chars
+        return ''.join(sorted(chars))
+
+
+def compile_pattern(pattern,rng,min_length = None,max_length = None):
+    '''PatternSampler for pattern, or None if it uses constructs the sampler does not handle (lookarounds,
+    conditionals, backreferences to groups of variable length...).'''
+    try:
+        return PatternSampler(pattern,rng,min_length,max_length)
+    except UnsupportedPattern:
+        return None
@@ -0,0 +1,443 @@
+from itertools import izip, repeat
+from json.encoder import JSONEncoder, encode_basestring_ascii
+
+#consecutive duplicates after which a uniqueItems array gives up looking for new items
+MAX_DUPLICATES = 1000
+
+_encode = JSONEncoder(separators = (',',':')).encode
+
+
+def _encode_float(value):
+    if value != value:
+        return 'NaN'
+    elif value in (float('inf'),float('-inf')):
+        return 'Infinity' if value > 0 else '-Infinity'
+    return repr(value)
+
+
+#encoders of the scalar types, giving the same JSON as json.dumps
+ENCODERS = {
+    str: encode_basestring_ascii,
+    unicode: encode_basestring_ascii,
+    int: str,
+    long: str,
+    float: _encode_float,
+    bool: lambda value: 'true' if value else 'false',
+    type(None): lambda value: 'null'
+}
+
+
+#for encode_values(), which maps C functions over whole lists of one scalar type
+_BOOLEANS = {True:'true',False:'false'}
+_NON_FINITE = ('nan','inf','-inf')
+
+
+def encode_value(value):
+    '''JSON of a generated value, as compact as json.dumps(value,separators=(',',':')).'''
+    encode = ENCODERS.get(type(value))
+    if encode is None:
+        return _encode(value)
+    return encode(value)
+
+
+def encode_values(values):
+    '''map(encode_value,values), faster when the values all have the same type, as generated values mostly do.'''
+    if not values:
+        return []
+    value_type = type(values[0])
+    if len(set(map(type,values))) == 1:
+        if value_type is str or value_type is unicode:
+            return map(encode_basestring_ascii,values)
+        elif value_type is int or value_type is long:
+            return map(str,values)
+        elif value_type is float:
+            encoded = map(repr,values)
+            if not any(text in encoded for text in _NON_FINITE):
+                return encoded
+        elif value_type is bool:
+            return map(_BOOLEANS.__getitem__,values)
+    return map(encode_value,values)
+
+
+def freeze(value):
+    '''Canonical hashable form of a json value, equal for equal json values: booleans are kept apart from numbers,
+    and objects compare regardless of key order.'''
+    if isinstance(value,bool):
+        return (bool,value)
+    elif isinstance(value,dict):
+        return (dict,frozenset((key,freeze(item)) for key,item in value.iteritems()))
+    elif isinstance(value,list):
+        return (list,tuple(freeze(item) for item in value))
+    return value
+
+
+def compile_refs(node,compiled = None):
+    '''Compile the targets of the recursive $refs under node now instead of on first use.'''
+    compiled = set() if compiled is None else compiled
+    if id(node) in compiled:
+        return
+    compiled.add(id(node))
+    if isinstance(node,ObjectNode):
+        for name,child,required in node.properties:
+            compile_refs(child,compiled)
+    elif isinstance(node,ArrayNode):
+        compile_refs(node.item,compiled)
+    elif isinstance(node,TupleNode):
+        for child in node.items:
+            compile_refs(child,compiled)
+    elif isinstance(node,RefNode):
+        if node.node is None:
+            node.node = node.compile_target()
+        compile_refs(node.node,compiled)
+
+
+def draws_per_document(node,counts = None,multiplier = 1,visited = None):
+    '''The most values one document draws from each generator under node, as {id(generator): [generator, count]}:
+    the product of the maxItems of the arrays holding it, summed over the keys sharing it. count is None under a
+    recursive $ref, whose expansions are not bounded per document. Recursive $refs are followed once compiled, see
+    compile_refs().'''
+    counts = {} if counts is None else counts
+    visited = set() if visited is None else visited
+    if isinstance(node,LeafNode):
+        entry = counts.setdefault(id(node.generator),[node.generator,0])
+        entry[1] = None if entry[1] is None or multiplier is None else entry[1]+multiplier
+    elif isinstance(node,ObjectNode):
+        for name,child,required in node.properties:
+            draws_per_document(child,counts,multiplier,visited)
+    elif isinstance(node,ArrayNode):
+        draws_per_document(node.item,counts,None if multiplier is None else multiplier*node.max_items,visited)
+    elif isinstance(node,TupleNode):
+        for child in node.items:
+            draws_per_document(child,counts,multiplier,visited)
+    elif isinstance(node,RefNode) and node.node is not None and id(node) not in visited:
+        visited.add(id(node))
+        draws_per_document(node.node,counts,None,visited)
+    return counts
+
+
+class NullNode(object):
+    '''Plan node for type "null".'''
+    __slots__ = ('key',)
+
+    def __init__(self,key):
+        self.key = key
+
+    def generate(self):
+        return None
+
+    def generate_many(self,k):
+        return [None]*k
+
+    def encode_many(self,k):
+        return ['null']*k
+
+
+class LeafNode(object):
+    '''Plan node for a string/integer/number/boolean key, bound to the generator instance cached for the key.'''
+    __slots__ = ('key','generator','generate')
+
+    def __init__(self,key,generator):
+        self.key = key
+        self.generator = generator
+        self.generate = generator.generate
+
+    def generate_many(self,k):
+        if hasattr(self.generator,'generate_many'):
+            return self.generator.generate_many(k)
+        generate = self.generate
+        return [generate() for i in xrange(k)]
+
+    def encode_many(self,k):
+        return encode_values(self.generate_many(k))
+
+
+class ObjectNode(object):
+    '''Plan node for type "object". properties is a sequence of (name, node, required) tuples. For encode_many(),
+    the names are encoded once, as the ',"name":' prefix of their values.'''
+    __slots__ = ('key','random','properties','fields','recursive','prefixes')
+
+    def __init__(self,key,properties,rng):
+        self.key = key
+        self.random = rng
+        self.properties = tuple(properties)
+        self.fields = tuple((name,node.generate,required) for name,node,required in properties)
+        self.recursive = any(isinstance(node,RefNode) for name,node,required in properties)
+        self.prefixes = tuple(','+encode_basestring_ascii(name)+':' for name,node,required in properties)
+
+    def generate(self):
+        if self.recursive:
+            return self.generate_bounded()
+        result_object = {}
+        rand = self.random.random
+        for name,generate,required in self.fields:
+            if required or rand() > 0.5:
+                result_object[name] = generate()
+        return result_object
+
+    def generate_bounded(self):
+        '''generate() for objects with recursive properties: optional ones are left out once the expansion budget is exhausted.'''
+        result_object = {}
+        rand = self.random.random
+        for name,node,required in self.properties:
+            if required or (rand() > 0.5 and not (isinstance(node,RefNode) and node.exhausted())):
+                result_object[name] = node.generate()
+        return result_object
+
+    def generate_many(self,k):
+        '''Build k objects column-wise: each property node generates the values for all objects containing it at once.'''
+        result_objects = [{} for i in xrange(k)]
+        rand = self.random.random
+        for name,node,required in self.properties:
+            if required:
+                for result_object,value in izip(result_objects,node.generate_many(k)):
+                    result_object[name] = value
+            elif isinstance(node,RefNode) and node.exhausted():
+                continue
+            else:
+                present = [result_object for result_object in result_objects if rand() > 0.5]
+                for result_object,value in izip(present,node.generate_many(len(present))):
+                    result_object[name] = value
+        return result_objects
+
+    def encode_many(self,k):
+        '''The JSON of generate_many(k), written directly without building the objects, drawing the same random
+        numbers. It is built column-wise: a column holds the members of one property in the k objects, '' where it
+        is left out.'''
+        columns = []
+        rand = self.random.random
+        for prefix,(name,node,required) in izip(self.prefixes,self.properties):
+            if required:
+                columns.append(repeat(prefix,k))
+                columns.append(node.encode_many(k))
+            elif isinstance(node,RefNode) and node.exhausted():
+                continue
+            else:
+                present = [i for i in xrange(k) if rand() > 0.5]
+                column = ['']*k
+                for i,value in izip(present,node.encode_many(len(present))):
+                    column[i] = prefix+value
+                columns.append(column)
+        if not columns:
+            return ['{}']*k
+        return ['{'+''.join(members)[1:]+'}' for members in izip(*columns)]
+
+
+class ArrayNode(object):
+    '''Plan node for type "array" whose "items" is a single schema.
+
+    With uniqueItems, items already in the array are tracked in a set of their canonical hashable form. When the item
+    generator can enumerate its values (enum, boolean, integer range...), arrays are sampled from them without
+    replacement instead, and a domain too small for minItems is reported when the plan is compiled.'''
+    __slots__ = ('key','random','item','min_items','max_items','unique_items','recursive','retries','domain')
+
+    def __init__(self,key,item,rng,min_items=1,max_items=10,unique_items=False):
+        self.key = key
+        self.random = rng
+        self.item = item
+        self.min_items = min_items
+        self.max_items = max_items
+        self.unique_items = unique_items
+        self.recursive = isinstance(item,RefNode)
+        #duplicates drawn for uniqueItems, reported by profiling
+        self.retries = 0
+        self.domain = None
+        if unique_items:
+            self.domain = self.__unique_domain()
+            if self.domain is not None:
+                if len(self.domain) < min_items:
+                    raise ValueError('{0}: uniqueItems requires {1} items, but only {2} distinct values can be generated'.format(key,min_items,len(self.domain)))
+                self.max_items = min(max_items,len(self.domain))
+
+    def __unique_domain(self):
+        if isinstance(self.item,NullNode):
+            return [None]
+        if not isinstance(self.item,LeafNode) or not hasattr(self.item.generator,'domain'):
+            return None
+        domain = self.item.generator.domain()
+        if domain is None or isinstance(domain,xrange):
+            return domain
+        seen = set()
+        distinct = []
+        for value in domain:
+            if freeze(value) not in seen:
+                seen.add(freeze(value))
+                distinct.append(value)
+        return distinct
+
+    def generate(self):
+        if self.recursive:
+            return self.generate_bounded()
+        actual_number = self.random.randrange(self.min_items,self.max_items+1)
+        if self.unique_items:
+            return self.generate_unique(actual_number)
+        generate = self.item.generate
+        return [generate() for i in xrange(actual_number)]
+
+    def generate_unique(self,actual_number,bounded = False):
+        if self.domain is not None:
+            return self.random.sample(self.domain,actual_number)
+        generate = self.item.generate
+        seen = set()
+        result_array = []
+        duplicates = 0
+        while len(result_array) < actual_number:
+            if bounded and len(result_array) >= self.min_items and self.item.exhausted():
+                break
+            temp = generate()
+            frozen = freeze(temp)
+            if frozen not in seen:
+                seen.add(frozen)
+                result_array.append(temp)
+                duplicates = 0
+                continue
+            duplicates += 1
+            self.retries += 1
+            if duplicates >= MAX_DUPLICATES:
+                #the item domain looks smaller than actual_number: settle for minItems if we have them
+                if len(result_array) >= self.min_items:
+                    break
+                raise ValueError('{0}: could not generate {1} unique items'.format(self.key,self.min_items))
+        return result_array
+
+    def generate_bounded(self):
+        '''generate() for arrays of recursive items: items beyond minItems are left out once the expansion budget is exhausted.'''
+        actual_number = self.random.randrange(self.min_items,self.max_items+1)
+        if self.unique_items:
+            return self.generate_unique(actual_number,bounded = True)
+        result_array = []
+        while len(result_array) < actual_number:
+            if len(result_array) >= self.min_items and self.item.exhausted():
+                break
+            result_array.append(self.item.generate())
+        return result_array
+
+    def generate_many(self,k):
+        if self.unique_items:
+            return [self.generate() for i in xrange(k)]
+        if self.recursive and self.item.exhausted():
+            lengths = [self.min_items]*k
+        else:
+            randrange = self.random.randrange
+            lengths = [randrange(self.min_items,self.max_items+1) for i in xrange(k)]
+        values = self.item.generate_many(sum(lengths))
+        result_arrays = []
+        start = 0
+        for length in lengths:
+            result_arrays.append(values[start:start+length])
+            start += length
+        return result_arrays
+
+    def encode_many(self,k):
+        if self.unique_items:
+            return ['['+','.join(encode_values(self.generate()))+']' for i in xrange(k)]
+        if self.recursive and self.item.exhausted():
+            lengths = [self.min_items]*k
+        else:
+            randrange = self.random.randrange
+            lengths = [randrange(self.min_items,self.max_items+1) for i in xrange(k)]
+        values = self.item.encode_many(sum(lengths))
+        result_arrays = []
+        start = 0
+        for length in lengths:
+            result_arrays.append('['+','.join(values[start:start+length])+']')
+            start += length
+        return result_arrays
+
+
+class TupleNode(object):
+    '''Plan node for type "array" whose "items" is a list of schemas.'''
+    __slots__ = ('key','items','generators')
+
+    def __init__(self,key,items):
+        self.key = key
+        self.items = items
+        self.generators = tuple(node.generate for node in items)
+
+    def generate(self):
+        return [generate() for generate in self.generators]
+
+    def generate_many(self,k):
+        if not self.items:
+            return [[] for i in xrange(k)]
+        columns = [node.generate_many(k) for node in self.items]
+        return [list(row) for row in izip(*columns)]
+
+    def encode_many(self,k):
+        if not self.items:
+            return ['[]']*k
+        columns = [node.encode_many(k) for node in self.items]
+        return ['['+','.join(row)+']' for row in izip(*columns)]
+
+
+class ExpansionBudget(object):
+    '''Bounds the expansion of recursive $refs: at most max_depth of them nested in each other, and at most
+    max_expansions of them per document.'''
+    __slots__ = ('max_depth','max_expansions','depth','expansions','limit')
+
+    def __init__(self,max_depth,max_expansions):
+        self.max_depth = max_depth
+        self.max_expansions = max_expansions
+        self.reset()
+
+    def reset(self,documents=1):
+        self.depth = 0
+        self.expansions = 0
+        self.limit = self.max_expansions*documents
+
+    def exhausted(self):
+        return self.depth >= self.max_depth or self.expansions >= self.limit
+
+
+class RefNode(object):
+    '''Plan node for a recursive $ref. The referred definition is compiled by compile_target() on first use, and expanded
+    only while the budget allows it. Parents leave out optional properties and extra array items once it is exhausted;
+    where a value is still required, the reference yields None.'''
+    __slots__ = ('key','compile_target','budget','node')
+
+    def __init__(self,key,compile_target,budget):
+        self.key = key
+        self.compile_target = compile_target
+        self.budget = budget
+        self.node = None
+
+    def exhausted(self):
+        return self.budget.exhausted()
+
+    def generate(self):
+        budget = self.budget
+        if budget.exhausted():
+            return None
+        if self.node is None:
+            self.node = self.compile_target()
+        budget.depth += 1
+        budget.expansions += 1
+        try:
+            return self.node.generate()
+        finally:
+            budget.depth -= 1
+
+    def generate_many(self,k):
+        budget = self.budget
+        if budget.exhausted():
+            return [None]*k
+        if self.node is None:
+            self.node = self.compile_target()
+        budget.depth += 1
+        budget.expansions += k
+        try:
+            return self.node.generate_many(k)
+        finally:
+            budget.depth -= 1
+
+    def encode_many(self,k):
+        budget = self.budget
+        if budget.exhausted():
+            return ['null']*k
+        if self.node is None:
+            self.node = self.compile_target()
+        budget.depth += 1
+        budget.expansions += k
+        try:
+            return self.node.encode_many(k)
+        finally:
+            budget.depth -= 1
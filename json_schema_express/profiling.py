@@ -0,0 +1,119 @@
+from timeit import default_timer as timer
+
+
+class FieldProfile(object):
+    '''Statistics of the plan node of one key: calls of generate()/generate_many() and the values they returned,
+    total and longest call time, retries (rejected draws), and the sizes of the strings and arrays generated.'''
+    def __init__(self,key):
+        self.key = key
+        self.calls = 0
+        self.values = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.retries = 0
+        self.sizes = 0
+        self.total_size = 0
+        self.max_size = 0
+
+    def add_size(self,value):
+        if isinstance(value,(basestring,list)):
+            size = len(value)
+            self.sizes += 1
+            self.total_size += size
+            if size > self.max_size:
+                self.max_size = size
+
+    def as_dict(self):
+        result = {
+            'calls':self.calls,
+            'values':self.values,
+            'total_time':self.total_time,
+            'max_time':self.max_time,
+            'mean_time':self.total_time/self.values if self.values else 0.0,
+            'retries':self.retries
+        }
+        if self.sizes:
+            result['mean_size'] = float(self.total_size)/self.sizes
+            result['max_size'] = self.max_size
+        return result
+
+
+class Profiler(object):
+    '''Records a FieldProfile per key for the plan nodes it instruments, and the time spent in each stack of nested
+    keys for flame graphs. Nodes are only instrumented when a producer is created with profile=True, so a producer
+    without profiling runs the plan unchanged.'''
+    def __init__(self):
+        self.fields = {}
+        self.stacks = {}
+        self.stack = []
+
+    def instrument(self,node,retry_source = None):
+        '''Replace node's generate() and generate_many() by timed versions. retry_source is the object whose retries
+        attribute counts its rejected draws, if any. Plan nodes have __slots__, so the node is moved to a subclass of
+        its own class overriding the two methods.'''
+        field = self.fields.setdefault(node.key,FieldProfile(node.key))
+        generate = node.generate
+        generate_many = node.generate_many
+
+        def profiled_generate(node):
+            if self.stack and self.stack[-1][0] is node:
+                return generate()
+            value = self.__call(node,field,retry_source,generate)
+            field.values += 1
+            field.add_size(value)
+            return value
+
+        def profiled_generate_many(node,k):
+            if self.stack and self.stack[-1][0] is node:
+                return generate_many(k)
+            values = self.__call(node,field,retry_source,generate_many,k)
+            field.values += len(values)
+            for value in values:
+                field.add_size(value)
+            return values
+
+        node_class = type(node)
+        node.__class__ = type(node_class.__name__,(node_class,),{
+            '__slots__':(),
+            'generate':profiled_generate,
+            'generate_many':profiled_generate_many
+        })
+        return node
+
+    def __call(self,node,field,retry_source,function,*args):
+        frame = [node,0.0]
+        self.stack.append(frame)
+        retries = retry_source.retries if retry_source is not None else 0
+        start = timer()
+        try:
+            return function(*args)
+        finally:
+            elapsed = timer()-start
+            self.stack.pop()
+            field.calls += 1
+            field.total_time += elapsed
+            if elapsed > field.max_time:
+                field.max_time = elapsed
+            if retry_source is not None:
+                field.retries += retry_source.retries-retries
+            path = ';'.join([parent.key for parent,child_time in self.stack]+[node.key])
+            self.stacks[path] = self.stacks.get(path,0.0)+elapsed-frame[1]
+            if self.stack:
+                self.stack[-1][1] += elapsed
+
+    def reset(self):
+        for key in self.fields.keys():
+            self.fields[key] = FieldProfile(key)
+        self.stacks = {}
+
+    def as_dict(self):
+        '''{key: statistics} for every profiled key.'''
+        return dict((key,field.as_dict()) for key,field in self.fields.items())
+
+    def folded(self):
+        '''The time spent in each stack of keys, in the folded format of flamegraph.pl and speedscope: one
+        "root;root.a;root.a.b <microseconds>" line per stack, counting the time not spent in nested keys.'''
+        lines = []
+        for path,seconds in sorted(self.stacks.items()):
+            lines.append('{0} {1}'.format(path,int(round(seconds*1000000))))
+        return '\n'.join(lines)+'\n' if lines else ''
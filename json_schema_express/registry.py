@@ -0,0 +1,108 @@
+'''Registry of the generator classes DataProducer can use, by name.
+
+Generators are registered with the register() decorator, or are discovered through the entry points of the
+"json_schema_express.generators" group, named after the generator:
+
+    setup(...,entry_points = {'json_schema_express.generators': ['MyGenerator = mypackage.generators:MyGenerator']})
+
+Names can also be the dotted path of a class, e.g. "mypackage.generators.MyGenerator".'''
+
+import importlib
+
+ENTRY_POINT_GROUP = 'json_schema_express.generators'
+
+
+class GeneratorRegistration(object):
+    '''A registered generator class and its capabilities:
+    batch: it provides generate_many(k)
+    vectorised: generate_many() draws whole arrays at once, which makes it faster than the generic implementation
+    thread_safe: one instance can be called from several threads at once, and is shared by the threads of a thread-safe
+    DataProducer. Only for generators whose state must be shared (e.g. a counter): the others get an instance per thread,
+    drawing from the RNG of the thread, which keeps each thread's values reproducible
+    stateless: it keeps no state between calls but draws from the RNG it is given, so keys with identical definitions
+    can share one instance
+    alternative_to: the name of the generator it can replace, for the planner to choose the fastest implementation
+    requires: modules it needs, so that an alternative is only chosen when they are installed'''
+    def __init__(self,name,generator_class,batch = None,vectorised = False,thread_safe = False,stateless = False,alternative_to = None,requires = ()):
+        self.name = name
+        self.generator_class = generator_class
+        self.batch = hasattr(generator_class,'generate_many') if batch is None else batch
+        self.vectorised = vectorised
+        self.thread_safe = thread_safe
+        self.stateless = stateless
+        self.alternative_to = alternative_to
+        self.requires = tuple(requires)
+
+    def available(self):
+        '''Whether the modules the generator requires can be imported.'''
+        for module in self.requires:
+            try:
+                importlib.import_module(module)
+            except ImportError:
+                return False
+        return True
+
+
+class GeneratorRegistry(object):
+    def __init__(self):
+        self.registrations = {}
+        self.alternatives = {}
+
+    def register(self,generator_class = None,name = None,**capabilities):
+        '''Register generator_class under name (its class name by default), with the capabilities of
+        GeneratorRegistration. Usable as a decorator, with or without arguments.'''
+        if generator_class is None:
+            return lambda generator_class: self.register(generator_class,name,**capabilities)
+        registration = GeneratorRegistration(name or generator_class.__name__,generator_class,**capabilities)
+        self.registrations[registration.name] = registration
+        if registration.alternative_to:
+            self.alternatives.setdefault(registration.alternative_to,[]).append(registration)
+        return generator_class
+
+    def lookup(self,name):
+        '''The registration of name: a registered name, an entry point or the dotted path of a class. A class
+        is looked up among the registered ones, and gets default capabilities if it is not registered.'''
+        if not isinstance(name,basestring):
+            for registration in self.registrations.values():
+                if registration.generator_class is name:
+                    return registration
+            return GeneratorRegistration(name.__name__,name)
+        if name not in self.registrations:
+            generator_class = self.__load_entry_point(name)
+            if generator_class is None and '.' in name:
+                (module,sep,attribute) = name.rpartition('.')
+                try:
+                    generator_class = getattr(importlib.import_module(module),attribute)
+                except (ImportError,AttributeError):
+                    pass
+            if generator_class is None:
+                raise ValueError('Unknown generator: '+name)
+            registration = self.lookup(generator_class)
+            if registration.name not in self.registrations:
+                self.register(generator_class,name)
+            else:
+                self.registrations[name] = registration
+        return self.registrations[name]
+
+    def resolve(self,name,vectorised = False):
+        '''The registration to use for name. With vectorised, a vectorised alternative to it is preferred when one
+        is registered and available.'''
+        registration = self.lookup(name)
+        if vectorised and not registration.vectorised:
+            for alternative in self.alternatives.get(registration.name,[]):
+                if alternative.vectorised and alternative.available():
+                    return alternative
+        return registration
+
+    def __load_entry_point(self,name):
+        try:
+            import pkg_resources
+        except ImportError:
+            return None
+        for entry_point in pkg_resources.iter_entry_points(ENTRY_POINT_GROUP,name):
+            return entry_point.load()
+        return None
+
+
+registry = GeneratorRegistry()
+register = registry.register
@@ -0,0 +1,66 @@
+import json
+from urlparse import unquote
+from document_cache import default_cache
+from schema_cache import digest
+
+
+def resolve_pointer(document,pointer):
+    '''Follow a JSON pointer (RFC 6901, as found in the fragment of a $ref) inside document and return the target itself.'''
+    target = document
+    if not pointer:
+        return target
+    if not pointer.startswith('/'):
+        raise ValueError('Invalid JSON pointer: '+pointer)
+    for token in pointer[1:].split('/'):
+        token = unquote(token).replace('~1','/').replace('~0','~')
+        try:
+            if isinstance(target,list):
+                target = target[int(token)]
+            else:
+                target = target[token]
+        except (KeyError,IndexError,ValueError,TypeError):
+            raise ValueError('Unresolvable JSON pointer: '+pointer)
+    return target
+
+
+class RefResolver(object):
+    '''Resolve $ref strings to the definitions they refer to. Referred documents are loaded once, through a DocumentCache
+    shared with other resolvers, and resolved targets are memoised by (document, pointer) and shared rather than copied.'''
+    def __init__(self,schema,base_dir = '.',base_uri = '',document_cache = None):
+        self.schema = schema
+        self.document_cache = document_cache or default_cache
+        self.base_dir = base_dir
+        self.base_uri = base_uri
+        self.documents = {}
+        #URL or path of every document loaded -> digest of its text
+        self.digests = {}
+        self.targets = {}
+
+    def resolve(self,ref_string,document = ''):
+        '''Return the definition ref_string refers to, and the document holding it. A reference without a file part
+        refers to document, the one it was found in.'''
+        (json_file,sep,json_path) = ref_string.partition('#')
+        if not json_file:
+            json_file = document
+        if (json_file,json_path) not in self.targets:
+            self.targets[(json_file,json_path)] = resolve_pointer(self.get_document(json_file),json_path)
+        return (self.targets[(json_file,json_path)],json_file)
+
+    def get_document(self,json_file = ''):
+        if not self.base_uri and not json_file:
+            #refer to itself
+            return self.schema
+        elif json_file not in self.documents:
+            if self.base_uri:
+                #refer to remote object
+                if json_file:
+                    location = self.base_uri+'/'+json_file
+                else:
+                    location = self.base_uri
+            else:
+                #refer to another local file
+                location = self.base_dir+'/'+json_file
+            text = self.document_cache.read(location)
+            self.documents[json_file] = json.loads(text)
+            self.digests[location] = digest(text)
+        return self.documents[json_file]
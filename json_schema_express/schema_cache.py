@@ -0,0 +1,132 @@
+'''Cache of validated schemas with their $refs resolved, shared by the producers built from the same schema.
+
+Entries are keyed by a fingerprint of the schema and of the directory its local $refs are relative to. They are checked
+against the documents the schema refers to before being reused, so an edited referred file is resolved again.'''
+
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+#bumped whenever what is pickled changes, so that files written by other versions are ignored
+FORMAT_VERSION = 1
+
+#the JSON of a value, equal for equal values regardless of key order
+canonical = json.JSONEncoder(sort_keys = True,separators = (',',':')).encode
+
+
+def fingerprint(schema,base_dir = '.'):
+    '''sha1 of the canonical JSON of schema and of the absolute base_dir.'''
+    return hashlib.sha1(canonical([FORMAT_VERSION,schema,os.path.abspath(base_dir)])).hexdigest()
+
+
+def digest(text):
+    if isinstance(text,unicode):
+        text = text.encode('utf-8')
+    return hashlib.sha1(text).hexdigest()
+
+
+class ResolvedSchema(object):
+    '''A validated schema as DataProducer compiles it. root is the schema with every $ref replaced by the definition it
+    refers to (shared, not copied), but the recursive ones. recursive_refs maps the id() of those to their targets.
+    documents holds the digest of every referred document by location. identities memoises the canonical JSON of
+    leaf definitions by id(), for the producers to share generators between identical leaves.'''
+    def __init__(self,root,recursive_refs,base_uri = '',documents = None):
+        self.root = root
+        self.refs = [ref for ref,target in recursive_refs]
+        self.recursive_refs = dict((id(ref),target) for ref,target in recursive_refs)
+        self.base_uri = base_uri
+        self.documents = documents or {}
+        self.identities = {}
+
+    def __getstate__(self):
+        #ids do not survive pickling: recursive refs are saved as objects, which pickle shares with root
+        return {'root':self.root,'recursive_refs':[(ref,self.recursive_refs[id(ref)]) for ref in self.refs],
+                'base_uri':self.base_uri,'documents':self.documents}
+
+    def __setstate__(self,state):
+        self.__init__(state['root'],state['recursive_refs'],state['base_uri'],state['documents'])
+
+    def is_current(self,document_cache):
+        '''Whether the referred documents are unchanged.'''
+        for location,document_digest in self.documents.items():
+            try:
+                if digest(document_cache.read(location)) != document_digest:
+                    return False
+            except (IOError,OSError):
+                return False
+        return True
+
+
+class SchemaCache(object):
+    '''ResolvedSchemas by fingerprint, the max_entries most recently used ones in memory. With cache_dir, entries are
+    also pickled there, so that a new process loads them instead of validating and resolving the schema again. Only
+    point cache_dir to a directory you trust: loading a pickle can run arbitrary code.'''
+    def __init__(self,cache_dir = None,max_entries = 256):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        if cache_dir and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def get(self,key,document_cache):
+        '''The entry of key, if any and if its referred documents are unchanged.'''
+        with self.lock:
+            resolved = self.entries.pop(key,None)
+        if resolved is None:
+            resolved = self.__read_disk(key)
+        if resolved is None or not resolved.is_current(document_cache):
+            return None
+        self.put(key,resolved,False)
+        return resolved
+
+    def put(self,key,resolved,persist = True):
+        with self.lock:
+            self.entries.pop(key,None)
+            self.entries[key] = resolved
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last = False)
+        if persist:
+            self.__write_disk(key,resolved)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+        if self.cache_dir:
+            for name in os.listdir(self.cache_dir):
+                if name.endswith('.pickle'):
+                    os.remove(os.path.join(self.cache_dir,name))
+
+    def __disk_path(self,key):
+        return os.path.join(self.cache_dir,key+'.pickle')
+
+    def __read_disk(self,key):
+        if not self.cache_dir or not os.path.exists(self.__disk_path(key)):
+            return None
+        try:
+            with open(self.__disk_path(key),'rb') as f:
+                (version,entry_key,resolved) = pickle.load(f)
+        except Exception:
+            #truncated, or written by an incompatible version
+            return None
+        if version != FORMAT_VERSION or entry_key != key:
+            return None
+        return resolved
+
+    def __write_disk(self,key,resolved):
+        if not self.cache_dir:
+            return
+        path = self.__disk_path(key)
+        temp_path = '{0}.{1}.tmp'.format(path,os.getpid())
+        with open(temp_path,'wb') as f:
+            pickle.dump((FORMAT_VERSION,key,resolved),f,pickle.HIGHEST_PROTOCOL)
+        os.rename(temp_path,path)
+
+
+default_schema_cache = SchemaCache()
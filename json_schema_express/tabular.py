@@ -0,0 +1,123 @@
+'''Tabular export of generated documents, for loading them into databases and warehouses.
+
+The properties of objects are flattened into columns named after their dotted path, e.g. "address.city", the keys of
+the plan without the leading "root.". Arrays, tuples and recursive $refs are not flattened: each of them is one column
+holding its JSON. A property left out of a document gives an empty cell (null in Arrow and Parquet), in all the
+columns it spans.'''
+
+import csv
+from itertools import izip
+
+from plan import ObjectNode, LeafNode, NullNode, RefNode, encode_value
+
+#type of the columns of each JSON type, by pyarrow factory name; "json" is the type of the columns holding JSON
+ARROW_TYPES = {
+    'integer':'int64',
+    'number':'float64',
+    'boolean':'bool_',
+    'string':'string',
+    'null':'null',
+    'json':'string'
+}
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError('Arrow and Parquet export require pyarrow to be installed.')
+    return pyarrow
+
+
+def table_columns(node,obj_def,name = 'root'):
+    '''The (name, type) of the columns of node, compiled from obj_def: type is the JSON type of the values, or "json"
+    for the columns holding JSON.'''
+    if isinstance(node,ObjectNode):
+        columns = []
+        for key,child,required in node.properties:
+            child_name = key if name == 'root' else name+'.'+key
+            columns.extend(table_columns(child,obj_def['properties'][key],child_name))
+        return columns
+    elif isinstance(node,(LeafNode,NullNode)):
+        return [(name,obj_def['type'])]
+    return [(name,'json')]
+
+
+def columns_many(node,k):
+    '''The values of the columns of node in k documents, a list per column in the order of table_columns(). Draws the
+    same random numbers as node.generate_many(k), so a row holds the flattened document generate_many() would give.'''
+    if isinstance(node,ObjectNode):
+        columns = []
+        rand = node.random.random
+        for key,child,required in node.properties:
+            if required:
+                columns.extend(columns_many(child,k))
+            elif isinstance(child,RefNode) and child.exhausted():
+                columns.append([None]*k)
+            else:
+                present = [i for i in xrange(k) if rand() > 0.5]
+                for values in columns_many(child,len(present)):
+                    column = [None]*k
+                    for i,value in izip(present,values):
+                        column[i] = value
+                    columns.append(column)
+        return columns
+    elif isinstance(node,(LeafNode,NullNode)):
+        return [node.generate_many(k)]
+    return [node.encode_many(k)]
+
+
+def _csv_cell(value):
+    if value is None:
+        return ''
+    elif isinstance(value,unicode):
+        return value.encode('utf-8')
+    elif isinstance(value,str):
+        return value
+    #same text as in the JSON of the document: true/false, floats in full precision
+    return encode_value(value)
+
+
+def write_csv(output,columns,batches,header = True):
+    '''Write the batches of column values to output, a binary file object, as CSV in UTF-8. Returns the number of
+    rows written.'''
+    writer = csv.writer(output)
+    if header:
+        writer.writerow([name.encode('utf-8') if isinstance(name,unicode) else name for name,column_type in columns])
+    written = 0
+    for batch in batches:
+        writer.writerows(izip(*[map(_csv_cell,values) for values in batch]))
+        if batch:
+            written += len(batch[0])
+    return written
+
+
+def arrow_schema(columns):
+    pyarrow = _import_pyarrow()
+    return pyarrow.schema([pyarrow.field(name,getattr(pyarrow,ARROW_TYPES[column_type])()) for name,column_type in columns])
+
+
+def write_arrow(output,columns,batches,format = 'arrow'):
+    '''Write the batches of column values to output, a path or a pyarrow sink, as an Arrow IPC file (one record batch
+    per batch) or, with format="parquet", as a Parquet file (one row group per batch). Columns have the type of the
+    definition they are compiled from. Returns the number of rows written.'''
+    pyarrow = _import_pyarrow()
+    schema = arrow_schema(columns)
+    if format == 'parquet':
+        import pyarrow.parquet
+        writer = pyarrow.parquet.ParquetWriter(output,schema)
+    else:
+        writer = pyarrow.RecordBatchFileWriter(output,schema)
+    written = 0
+    try:
+        for batch in batches:
+            arrays = [pyarrow.array(values,type = field.type) for values,field in izip(batch,schema)]
+            record_batch = pyarrow.RecordBatch.from_arrays(arrays,schema.names)
+            if format == 'parquet':
+                writer.write_table(pyarrow.Table.from_batches([record_batch]))
+            else:
+                writer.write_batch(record_batch)
+            written += record_batch.num_rows
+    finally:
+        writer.close()
+    return written
@@ -1,11 +1,43 @@
 import os,sys
+import io
+import csv
 import json
+import tempfile
+import shutil
+import time
+import threading
+import BaseHTTPServer
 import re
+import random
 from copy import deepcopy
 import unittest
+import data_producer
 from data_producer import DataProducer
 from generators import *
-from jsonspec.pointer import extract
+from numpy_generators import *
+from document_cache import DocumentCache
+from plan import *
+import benchmark
+from registry import GeneratorRegistry, registry as default_registry
+from schema_cache import SchemaCache, fingerprint
+from date_format import DateFormat
+from datetime import datetime
+try:
+    import numpy
+except ImportError:
+    numpy = None
+try:
+    import asyncio
+except ImportError:
+    try:
+        import trollius as asyncio
+    except ImportError:
+        asyncio = None
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+from background import StopAsyncIteration
 
 class TestSchemaParse(unittest.TestCase):
     def test_no_ref(self):
@@ -232,6 +264,207 @@ class TestSchemaParse(unittest.TestCase):
         self.assertTrue(isinstance(value['billing_address']['plains'],basestring))
         self.assertTrue(isinstance(value['another_ref'],int))
 
+    def test_ref_shared_not_copied(self):
+        schema = {
+            "$schema": "http://json-schema.org/draft-04/schema#",
+            "definitions": {
+                "a/b~c": {
+                    "type": "object",
+                    "properties": {
+                        "code": {
+                            "type": "integer"
+                        }
+                    }
+                }
+            },
+            "type": "object",
+            "properties": {
+                "first": {
+                    "$ref": "#/definitions/a~1b~0c"
+                },
+                "second": {
+                    "$ref": "#/definitions/a~1b~0c"
+                },
+                "list": {
+                    "type": "array",
+                    "items": {
+                        "$ref": "#/definitions/a~1b~0c/properties/code"
+                    }
+                }
+            }
+        }
+        dp = DataProducer(schema)
+        target = dp.schema['definitions']['a/b~c']
+        self.assertTrue(dp.schema['properties']['first'] is target)
+        self.assertTrue(dp.schema['properties']['second'] is target)
+        self.assertTrue(dp.schema['properties']['list']['items'] is target['properties']['code'])
+        self.assertEqual(len(dp.resolver.targets),2)
+
+    def test_unresolvable_ref(self):
+        schema = {
+            "type": "object",
+            "properties": {
+                "missing": {
+                    "$ref": "#/definitions/missing"
+                }
+            }
+        }
+        self.assertRaises(ValueError,DataProducer,schema)
+
+    def test_nested_ref(self):
+        schema = {
+            "$schema": "http://json-schema.org/draft-04/schema#",
+            "definitions": {
+                "code": {
+                    "$ref": "#/definitions/integer_code"
+                },
+                "integer_code": {
+                    "type": "integer",
+                    "minimum": 1,
+                    "maximum": 3
+                },
+                "pair": {
+                    "type": "array",
+                    "items": [{"$ref": "#/definitions/code"},{"$ref": "test_string.json#/properties/plains"}]
+                }
+            },
+            "type": "object",
+            "properties": {
+                "pair": {
+                    "$ref": "#/definitions/pair"
+                }
+            },
+            "required": ["pair"]
+        }
+        dp = DataProducer(schema,'./sample_schemas')
+        self.assertEqual(dp.schema['properties']['pair']['items'],[{"type":"integer","minimum":1,"maximum":3},{"type":"string","maxLength":10,"minLength":5}])
+        value = dp.produce()
+        self.assertIn(value['pair'][0],range(1,4))
+        self.assertIn(len(value['pair'][1]),range(5,11))
+
+    def test_recursive_ref(self):
+        schema = {
+            "$schema": "http://json-schema.org/draft-04/schema#",
+            "definitions": {
+                "node": {
+                    "type": "object",
+                    "properties": {
+                        "value": {
+                            "type": "integer"
+                        },
+                        "children": {
+                            "type": "array",
+                            "minItems": 0,
+                            "maxItems": 4,
+                            "items": {"$ref": "#/definitions/node"}
+                        }
+                    },
+                    "required": ["value","children"]
+                }
+            },
+            "type": "object",
+            "properties": {
+                "tree": {
+                    "$ref": "#/definitions/node"
+                }
+            },
+            "required": ["tree"]
+        }
+        def depth(node):
+            return 1+max([depth(child) for child in node['children']] or [0])
+        def size(node):
+            return 1+sum([size(child) for child in node['children']])
+        dp = DataProducer(schema,max_ref_depth = 3,max_ref_expansions = 50)
+        #the recursive $ref is kept in the schema rather than expanded
+        self.assertEqual(dp.schema['definitions']['node']['properties']['children']['items'],{"$ref": "#/definitions/node"})
+        json.dumps(dp.schema)
+        for value in dp.produce_list(30):
+            self.assertTrue(depth(value['tree']) <= 4)
+            self.assertTrue(size(value['tree']) <= 51)
+        for value in dp.produce_batch(30):
+            self.assertTrue(depth(value['tree']) <= 4)
+        #workers get the producer's budget
+        for value in dp.produce_parallel(30,workers = 2,seed = 1,batch_size = 10):
+            self.assertTrue(depth(value['tree']) <= 4)
+        dp = DataProducer(schema,max_ref_depth = 50,max_ref_expansions = 20)
+        for value in dp.produce_list(30):
+            self.assertTrue(size(value['tree']) <= 21)
+
+    def test_circular_ref(self):
+        schema = {
+            "definitions": {
+                "a": {"$ref": "#/definitions/b"},
+                "b": {"$ref": "#/definitions/a"}
+            },
+            "type": "object",
+            "properties": {
+                "a": {"$ref": "#/definitions/a"}
+            }
+        }
+        self.assertRaises(ValueError,DataProducer,schema)
+
+    def test_schema_cache(self):
+        schema = {
+            "definitions": {
+                "node": {
+                    "type": "object",
+                    "properties": {
+                        "value": {"type": "integer"},
+                        "next": {"$ref": "#/definitions/node"}
+                    },
+                    "required": ["value"]
+                }
+            },
+            "type": "object",
+            "properties": {"list": {"$ref": "#/definitions/node"}},
+            "required": ["list"]
+        }
+        cache_dir = tempfile.mkdtemp()
+        try:
+            cache = SchemaCache(cache_dir)
+            dp = DataProducer(deepcopy(schema),seed = 5,schema_cache = cache)
+            self.assertTrue(dp.resolver is not None)
+            expected = dp.produce_list(10)
+            #same schema: validation and $ref resolution are skipped
+            dp = DataProducer(deepcopy(schema),seed = 5,schema_cache = cache)
+            self.assertEqual(dp.resolver,None)
+            self.assertEqual(dp.produce_list(10),expected)
+            #another process: the entry is loaded from disk
+            dp = DataProducer(deepcopy(schema),seed = 5,schema_cache = SchemaCache(cache_dir))
+            self.assertEqual(dp.resolver,None)
+            self.assertEqual(len(dp.recursive_refs),1)
+            self.assertEqual(dp.produce_list(10),expected)
+            #the schema the first producer resolved in place hits the cache as well
+            resolved = deepcopy(schema)
+            DataProducer(resolved,schema_cache = cache)
+            self.assertEqual(DataProducer(resolved,schema_cache = cache).resolver,None)
+            self.assertNotEqual(fingerprint(schema),fingerprint(schema,cache_dir))
+            self.assertTrue(DataProducer(deepcopy(schema),schema_cache = False).resolver is not None)
+            with open(os.path.join(cache_dir,fingerprint(schema)+'.pickle'),'wb') as f:
+                f.write('corrupt')
+            self.assertTrue(DataProducer(deepcopy(schema),schema_cache = SchemaCache(cache_dir)).resolver is not None)
+            #workers are sent the resolved schema
+            self.assertEqual(len(dp.produce_parallel(10,workers = 2,seed = 1,batch_size = 5)),10)
+            #editing a schema after building a producer from it leaves the cached entry unchanged
+            original = {"type":"object","properties":{"a":{"type":"integer","minimum":0,"maximum":3}},"required":["a"]}
+            edited = deepcopy(original)
+            DataProducer(edited,schema_cache = cache)
+            edited['properties']['a'].update({"minimum":100,"maximum":200})
+            dp = DataProducer(deepcopy(original),schema_cache = cache)
+            self.assertEqual(dp.resolver,None)
+            self.assertEqual(dp.schema['properties']['a']['maximum'],3)
+            self.assertTrue(all(0 <= value['a'] <= 3 for value in dp.produce_list(20)))
+            #the process-wide cache is opt-in
+            self.assertTrue(DataProducer(deepcopy(schema)).resolver is not None)
+            self.assertTrue(DataProducer(deepcopy(schema)).resolver is not None)
+            DataProducer(deepcopy(schema),schema_cache = True)
+            self.assertEqual(DataProducer(deepcopy(schema),schema_cache = True).resolver,None)
+            #a generator class cannot be fingerprinted: the schema is resolved without the cache
+            sequence = {"type":"integer","_generator_config":{"generator":StdIntegerSequence,"start":0,"step":1}}
+            self.assertEqual(DataProducer(sequence,schema_cache = cache).produce_list(3),[0,1,2])
+        finally:
+            shutil.rmtree(cache_dir)
+
 class TestDataGenerate(unittest.TestCase):
 
     def test_single_key_standard_generator(self):
@@ -241,9 +474,9 @@ class TestDataGenerate(unittest.TestCase):
                 "minimum":1
           }
         dp = DataProducer(schema)
-        self.assertEqual(dp.generator_cache,{})
-        self.assertIn(dp.produce(),range(1,6))
+        #generators are attached when the schema is compiled in __init__
         self.assertTrue(isinstance(dp.generator_cache['root'],StdIntegerRandom))
+        self.assertIn(dp.produce(),range(1,6))
         current_generator_id = id(dp.generator_cache['root'])
         for i in range(0,5):
             value = dp.produce()
@@ -326,6 +559,38 @@ class TestDataGenerate(unittest.TestCase):
         self.assertTrue(isinstance(dp.generator_cache['root.string_c'],StdStringRandom))
         self.assertTrue(isinstance(dp.generator_cache['root.bool_d'],StdBooleanRandom))
 
+    def test_compiled_plan(self):
+        schema = {
+            "type":"object",
+            "properties":{
+                "int_a":{
+                    "type":"integer"
+                },
+                "list_b":{
+                    "type":"array",
+                    "items":{"type":"boolean"}
+                },
+                "tuple_c":{
+                    "type":"array",
+                    "items":[{"type":"string"},{"type":"null"}]
+                }
+            },
+            "required":["int_a","list_b","tuple_c"]
+        }
+        dp = DataProducer(schema)
+        self.assertTrue(isinstance(dp.plan,ObjectNode))
+        nodes = dict((name,node) for name,node,required in dp.plan.properties)
+        self.assertTrue(isinstance(nodes['int_a'],LeafNode))
+        self.assertTrue(nodes['int_a'].generator is dp.generator_cache['root.int_a'])
+        self.assertTrue(isinstance(nodes['list_b'],ArrayNode))
+        self.assertTrue(nodes['list_b'].item.generator is dp.generator_cache['root.list_b.boolean'])
+        self.assertTrue(isinstance(nodes['tuple_c'],TupleNode))
+        self.assertTrue(isinstance(nodes['tuple_c'].items[1],NullNode))
+        self.assertEqual(sorted(dp.generator_cache.keys()),['root.int_a','root.list_b.boolean','root.tuple_c.0'])
+        value = dp.produce()
+        self.assertEqual(sorted(value.keys()),['int_a','list_b','tuple_c'])
+        self.assertEqual(value['tuple_c'][1],None)
+
     def test_array_list(self):
         schema = {
                 "$schema": "http://json-schema.org/draft-04/schema#",
@@ -347,6 +612,70 @@ class TestDataGenerate(unittest.TestCase):
             self.assertIn(v,range(15,34))
         self.assertTrue(len(value) == len(set(value)))
         
+    def test_array_unique_items(self):
+        schema = {
+            "type": "object",
+            "properties": {
+                "ids": {
+                    "type": "array",
+                    "minItems": 10000,
+                    "maxItems": 10000,
+                    "uniqueItems": True,
+                    "items": {"type": "integer","minimum": 0,"maximum": 10001}
+                },
+                "flags": {
+                    "type": "array",
+                    "minItems": 2,
+                    "maxItems": 10,
+                    "uniqueItems": True,
+                    "items": {"type": "boolean"}
+                },
+                "colors": {
+                    "type": "array",
+                    "minItems": 1,
+                    "uniqueItems": True,
+                    "items": {"type": "string","enum": ["red","green","red","blue"]}
+                },
+                "points": {
+                    "type": "array",
+                    "minItems": 5,
+                    "maxItems": 5,
+                    "uniqueItems": True,
+                    "items": {
+                        "type": "object",
+                        "properties": {"x": {"type": "integer","minimum": 0,"maximum": 2},"y": {"type": "boolean"}},
+                        "required": ["x","y"]
+                    }
+                }
+            },
+            "required": ["ids","flags","colors","points"]
+        }
+        dp = DataProducer(schema)
+        for value in [dp.produce()]+dp.produce_batch(2):
+            self.assertEqual(len(set(value['ids'])),10000)
+            self.assertTrue(all(0 <= v <= 10001 for v in value['ids']))
+            self.assertEqual(sorted(value['flags']),[False,True])
+            self.assertIn(len(value['colors']),range(1,4))
+            self.assertEqual(len(set(value['colors'])),len(value['colors']))
+            self.assertEqual(len(set((point['x'],point['y']) for point in value['points'])),5)
+
+    def test_array_unique_items_domain_too_small(self):
+        schema = {
+            "type": "array",
+            "minItems": 4,
+            "uniqueItems": True,
+            "items": {"type": "integer","minimum": 1,"maximum": 6,"multipleof": 2}
+        }
+        self.assertRaises(ValueError,DataProducer,schema)
+        schema = {
+            "type": "array",
+            "minItems": 3,
+            "uniqueItems": True,
+            "items": {"type": "string","pattern": "[ab]"}
+        }
+        dp = DataProducer(schema)
+        self.assertRaises(ValueError,dp.produce)
+
     def test_array_tuple(self):
         schema = {
             "type": "array",
@@ -453,6 +782,108 @@ class TestDataGenerate(unittest.TestCase):
         self.assertEqual(len(value),1)
         self.assertTrue(pat.match(value['ipv4']))
 
+    def test_format_shared_faker(self):
+        properties = {}
+        for i in range(50):
+            properties['email{0}'.format(i)] = {"type":"string","format":"email"}
+        properties['ipv6'] = {"type":"string","format":"ipv6","_generator_config":{"pool_size":100}}
+        schema = {"type":"object","properties":properties,"required":sorted(properties.keys())}
+        dp = DataProducer(schema,seed=7)
+        first = dp.produce_list(5)
+        self.assertEqual(DataProducer(schema,seed=7).produce_list(5),first)
+        self.assertEqual(len(dp.generator_cache['root.ipv6'].pool),100)
+        factories = set(id(getattr(generator,'generator',generator).factory) for generator in dp.generator_cache.values())
+        self.assertEqual(len(factories),1)
+        self.assertTrue(all('@' in value['email0'] for value in first))
+
+    def test_format_date_time(self):
+        schema = json.load(open('sample_schemas/test_format_datetime.json'))
+        schema['properties']['rfc3339'] = {"type":"string","format":"date-time"}
+        schema['properties']['daily'] = {
+            "type":"string",
+            "format":"date-time",
+            "_generator_config":{"date_format":"%Y-%m-%d","from":"1800-01-01T00:00:00+01:00","to":"1800-01-31"}
+        }
+        schema['required'] = sorted(schema['properties'].keys())
+        values = DataProducer(schema,seed = 2).produce_batch(200)+DataProducer(schema,seed = 2).produce_list(20)
+        for value in values:
+            self.assertTrue('2015/01/01 00:00:00' <= value['year2015'] <= '2015/12/31 23:59:59')
+            self.assertTrue(value['fromnow'] >= '2016/01/07 00:00:00')
+            self.assertTrue(value['untilnow'] <= '2016/01/06 23:59:59')
+            self.assertEqual(datetime.strptime(value['rfc3339'],'%Y-%m-%dT%H:%M:%SZ').strftime('%Y-%m-%dT%H:%M:%SZ'),value['rfc3339'])
+            self.assertTrue('1799-12-31' <= value['daily'] <= '1800-01-31')
+        formatter = DateFormat('%d/%m/%Y %H:%M:%S %Z%z %%')
+        self.assertFalse(formatter.iso)
+        self.assertEqual(formatter.format_many([0,951825600]),['01/01/1970 00:00:00 UTC+0000 %','29/02/2000 12:00:00 UTC+0000 %'])
+        self.assertEqual(formatter.parse('29/02/2000 12:00:00 UTC+0000 %'),951825600)
+        self.assertEqual(DateFormat().format(-1),'1969-12-31T23:59:59Z')
+        for date_format in ('%Y-%m-%dT%H:%M:%S.%fZ','%d/%m/%Y %H:%M:%S.%f'):
+            formatter = DateFormat(date_format)
+            text = formatter.format(227114095)
+            self.assertEqual(text,datetime(1977,3,13,15,14,55).strftime(date_format))
+            self.assertEqual(formatter.parse(text),227114095)
+        self.assertEqual(DateFormat('%%f %S').format(0),'%f 00')
+        self.assertEqual(DateFormat().parse('2000-02-29T14:30:00+02:30'),951825600)
+        self.assertRaises(ValueError,DateFormat().parse,'29/02/2000')
+        self.assertRaises(ValueError,StdDateTimeRandom,{"_generator_config":{"date_format":"%d/%m/%Y","from":"01/01/1800"}})
+        self.assertRaises(ValueError,StdDateTimeRandom,{"_generator_config":{"distribution":"zipf"}})
+        day = {"from":"2020-01-01","to":"2020-01-02"}
+        for options in ({"distribution":"normal","mean":"2030-01-01"},{"distribution":"normal","stddev":-1},{"distribution":"exponential","scale":-1}):
+            options.update(day)
+            self.assertRaises(ValueError,StdDateTimeRandom,{"_generator_config":options})
+
+        normal = StdDateTimeRandom({"_generator_config":{"from":"2020-01-01","to":"2020-01-02","distribution":"normal","stddev":3600}},rng = random.Random(1))
+        seconds = normal.draw_many(2000)
+        self.assertTrue(all(normal.from_long <= value <= normal.to_long for value in seconds))
+        self.assertTrue(abs(sum(seconds)/len(seconds)-normal.mean) < 600)
+        exponential = StdDateTimeRandom({"_generator_config":{"from":"2020-01-01","to":"2020-01-02","distribution":"exponential","scale":60}},rng = random.Random(1))
+        self.assertTrue(sorted(exponential.draw_many(2000))[1000] < exponential.from_long+120)
+        #distributions far wider than the range are truncated to it, without redrawing
+        minute = {"from":"2020-01-01T00:00:00Z","to":"2020-01-01T00:01:00Z"}
+        for options in ({"distribution":"normal","stddev":86400},{"distribution":"exponential","scale":2592000},{"distribution":"normal","stddev":0}):
+            options.update(minute)
+            generator = StdDateTimeRandom({"_generator_config":options},rng = random.Random(1))
+            seconds = generator.draw_many(2000)
+            self.assertTrue(all(generator.from_long <= value <= generator.to_long for value in seconds))
+            if options['distribution'] != 'normal' or options['stddev']:
+                self.assertTrue(len(set(seconds)) > 50)
+
+    def test_value_pool(self):
+        schema = {
+            "type":"object",
+            "properties":{
+                "code":{"type":"string","pattern":"[A-Z]{3}[0-9]{3}","_generator_config":{"pool_size":10,"pool_refresh":0.2}},
+                "name":{"type":"string","minLength":8,"maxLength":8},
+                "count":{"type":"integer"}
+            },
+            "required":["code","name","count"]
+        }
+        dp = DataProducer(schema,seed = 3)
+        pool = dp.generator_cache['root.code']
+        self.assertTrue(isinstance(pool,PooledGenerator))
+        codes = [x['code'] for x in dp.produce_list(10)]+[x['code'] for x in dp.produce_batch(10)]
+        self.assertTrue(all(re.match('^[A-Z]{3}[0-9]{3}$',code) for code in codes))
+        #after 20 draws, the pool was refreshed once: 2 of its 10 values are new
+        self.assertTrue(len(set(codes)-set(pool.pool)) <= 2)
+        self.assertTrue(len(set(codes)) <= 12)
+        self.assertEqual([x['code'] for x in DataProducer(schema,seed = 3).produce_list(10)],codes[:10])
+        state = dp.getstate()
+        expected = dp.produce_batch(25)
+        dp.setstate(state)
+        self.assertEqual(dp.produce_batch(25),expected)
+        dp.seed(4)
+        first = dp.produce_list(5)
+        self.assertEqual(DataProducer(schema,seed = 4).produce_list(5),first)
+        #pools for whole types through the generator mapping, with the default refresh
+        dp = DataProducer(schema,generator_mapping = {"string":{"generator":"StdStringRandom","pool_size":50}},seed = 3)
+        self.assertEqual(dp.generator_cache['root.name'].pool_size,50)
+        self.assertEqual(dp.generator_cache['root.name'].refresh,5)
+        self.assertEqual(dp.generator_cache['root.code'].pool_size,10)
+        self.assertFalse(isinstance(dp.generator_cache['root.count'],PooledGenerator))
+        names = set(x['name'] for x in dp.produce_batch(200))
+        self.assertTrue(50 < len(names) <= 50+5*3)
+        self.assertRaises(ValueError,DataProducer,schema,generator_mapping = {"string":{"generator":"StdStringRandom","pool_size":10,"pool_refresh":0}})
+
     def test_produce_list_default_length(self):
         schema = {
             "type":"integer",
@@ -482,6 +913,688 @@ class TestDataGenerate(unittest.TestCase):
         dp = DataProducer(schema)
         self.assertEqual(dp.produce_list('a'),[])
 
+    def test_produce_batch(self):
+        schema = {
+            "type":"object",
+            "properties":{
+                "int_a":{
+                    "type":"integer",
+                    "maximum":9,
+                    "minimum":4,
+                    "exclusiveminimum":True
+                },
+                "string_b":{
+                    "type":"string",
+                    "maxLength":6,
+                    "minLength":3
+                },
+                "seq_c":{
+                    "type":"integer",
+                    "_generator_config":{"start":0,"step":2,"generator":"StdIntegerSequence"}
+                },
+                "list_d":{
+                    "type":"array",
+                    "minItems":2,
+                    "maxItems":4,
+                    "items":{"type":"number","minimum":1.0,"maximum":2.0}
+                },
+                "tuple_e":{
+                    "type":"array",
+                    "items":[{"type":"boolean"},{"type":"null"}]
+                },
+                "ipv4_f":{
+                    "type":"string",
+                    "format":"ipv4"
+                }
+            },
+            "required":["int_a","seq_c","list_d","tuple_e","ipv4_f"]
+        }
+        dp = DataProducer(schema)
+        results = dp.produce_batch(200)
+        self.assertEqual(len(results),200)
+        self.assertEqual([value['seq_c'] for value in results],range(0,400,2))
+        b_present = b_no_present = False
+        for value in results:
+            self.assertIn(value['int_a'],range(5,10))
+            self.assertIn(len(value['list_d']),range(2,5))
+            for v in value['list_d']:
+                self.assertTrue(1.0 <= v <= 2.0)
+            self.assertIn(value['tuple_e'][0],(True,False))
+            self.assertEqual(value['tuple_e'][1],None)
+            self.assertEqual(len(value['ipv4_f'].split('.')),4)
+            if 'string_b' in value:
+                self.assertIn(len(value['string_b']),range(3,7))
+                b_present = True
+            else:
+                b_no_present = True
+        self.assertTrue(b_present and b_no_present)
+        self.assertEqual(dp.produce_batch(0),[])
+        self.assertEqual(dp.produce_batch('a'),[])
+
+    def test_generate_many(self):
+        generator = StdIntegerRandom({"minimum":3,"maximum":12,"multipleof":3,"exclusivemaximum":True})
+        self.assertEqual(set(generator.generate_many(500)),set([3,6,9]))
+        generator = StdNumberRandom({"minimum":1.0,"maximum":2.0,"multipleof":0.5})
+        for v in generator.generate_many(100):
+            self.assertIn(v,(1.0,1.5))
+        generator = StdStringRandom({"minLength":2,"maxLength":4})
+        for v in generator.generate_many(100):
+            self.assertIn(len(v),range(2,5))
+        generator = StdIntegerSequence({"_generator_config":{"start":5,"step":5}})
+        self.assertEqual(generator.generate_many(3),[5,10,15])
+        self.assertEqual(generator.generate(),20)
+
+    def test_string_pattern(self):
+        cases = [
+            ("[A-Z]{4,10}[0-9]\\.[a-z]{2}",{},range(8,15)),
+            ("[a-z]+@[a-z]+\\.com",{"maxLength":12},range(7,13)),
+            ("(ab|cdef)+",{"minLength":3,"maxLength":9},(4,6,8)),
+            ("^(\\w{2})-\\1$",{},(5,)),
+            ("[^abc]{2,5}x?",{"minLength":4,"maxLength":4},(4,)),
+            ("(?=a)a",{},(1,2))
+        ]
+        for pattern,lengths,expected in cases:
+            config = dict(lengths,pattern=pattern)
+            generator = StdStringRandom(config)
+            for v in generator.generate_many(200)+[generator.generate()]:
+                self.assertTrue(re.search(pattern,v),pattern)
+                self.assertIn(len(v),expected)
+        self.assertRaises(ValueError,StdStringRandom,{"pattern":"[0-9]{5}","maxLength":4})
+
+    @unittest.skipIf(numpy is None,'numpy is not installed')
+    def test_numpy_generators_in_init(self):
+        schema = {
+            "type":"object",
+            "properties":{
+                "int_a":{
+                    "type":"integer",
+                    "maximum":12,
+                    "minimum":3,
+                    "multipleof":3,
+                    "exclusiveminimum":True
+                },
+                "int_b":{
+                    "type":"integer"
+                },
+                "float_c":{
+                    "type":"number",
+                    "maximum":2.0,
+                    "minimum":1.0,
+                    "multipleof":0.5,
+                    "exclusivemaximum":True
+                },
+                "bool_d":{
+                    "type":"boolean"
+                }
+            },
+            "required":["int_a","int_b","float_c","bool_d"]
+        }
+        dp = DataProducer(schema,generator_mapping = {"integer":"NumpyIntegerRandom","number":"NumpyNumberRandom","boolean":"NumpyBooleanRandom"})
+        self.assertTrue(isinstance(dp.generator_cache['root.int_a'],NumpyIntegerRandom))
+        self.assertTrue(isinstance(dp.generator_cache['root.float_c'],NumpyNumberRandom))
+        self.assertTrue(isinstance(dp.generator_cache['root.bool_d'],NumpyBooleanRandom))
+        results = dp.produce_batch(300)+dp.produce_list(300)
+        self.assertEqual(set(value['int_a'] for value in results),set([6,9,12]))
+        self.assertEqual(set(value['float_c'] for value in results),set([1.0,1.5]))
+        self.assertEqual(set(value['bool_d'] for value in results),set([True,False]))
+        for value in results:
+            self.assertTrue(isinstance(value['int_b'],(int,long)))
+            self.assertTrue(-sys.maxint-1 <= value['int_b'] <= sys.maxint)
+        state = dp.getstate()
+        values = dp.produce_list(5)
+        dp.setstate(state)
+        self.assertEqual(dp.produce_list(5),values)
+        generator = NumpyIntegerRandom({"enum":[1,5,7]})
+        self.assertEqual(set(generator.generate_many(100)),set([1,5,7]))
+
+    def test_generator_registry(self):
+        registry = GeneratorRegistry()
+
+        @registry.register(thread_safe = True)
+        class Constant(object):
+            def __init__(self,config):
+                self.value = config['_generator_config']['value']
+
+            def generate(self):
+                return self.value
+
+        registry.register(Constant,'FastConstant',vectorised = True,alternative_to = 'Constant')
+        registry.register(Constant,'MissingConstant',vectorised = True,alternative_to = 'Constant',requires = ('no_such_module',))
+        self.assertIs(registry.lookup('Constant').generator_class,Constant)
+        self.assertTrue(registry.lookup('Constant').thread_safe)
+        self.assertFalse(registry.lookup('Constant').batch)
+        self.assertEqual(registry.resolve('Constant').name,'Constant')
+        self.assertEqual(registry.resolve('Constant',vectorised = True).name,'FastConstant')
+        self.assertEqual(registry.lookup('generators.StdIntegerSequence').generator_class.__name__,'StdIntegerSequence')
+        self.assertRaises(ValueError,registry.lookup,'NoSuchGenerator')
+
+        schema = {"type":"object","properties":{"a":{"type":"integer","_generator_config":{"value":5,"generator":"test_registry_constant"}}},"required":["a"]}
+        default_registry.register(Constant,'test_registry_constant')
+        self.assertEqual(DataProducer(schema).produce(),{"a":5})
+        schema = {"type":"integer","_generator_config":{"value":6}}
+        self.assertEqual(DataProducer(schema,generator_mapping = {"integer":Constant}).produce(),6)
+        self.assertRaises(ValueError,DataProducer,{"type":"integer","_generator_config":{"generator":"NoSuchGenerator"}})
+        if numpy is not None:
+            dp = DataProducer({"type":"integer"},vectorised = True)
+            self.assertIsInstance(dp.generator_cache['root'],NumpyIntegerRandom)
+        self.assertIsInstance(DataProducer({"type":"integer"}).generator_cache['root'],StdIntegerRandom)
+
+    def test_thread_safe(self):
+        schema = {
+            "type": "object",
+            "properties": {
+                "id": {"type": "integer","_generator_config": {"generator": "StdIntegerSequence","start": 1,"step": 1}},
+                "name": {"type": "string","pattern": "[a-z]{5}"},
+                "tags": {"type": "array","minItems": 3,"maxItems": 3,"uniqueItems": True,"items": {"type": "integer","minimum": 0,"maximum": 5}}
+            },
+            "required": ["id","name","tags"]
+        }
+        dp = DataProducer(schema,seed = 3,thread_safe = True)
+        results = []
+        plans = []
+        def work():
+            documents = dp.produce_list(300)+dp.produce_batch(200)
+            plans.append(dp._DataProducer__thread_producer())
+            results.extend(documents)
+        threads = [threading.Thread(target = work) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(document['id'] for document in results),range(1,4001))
+        self.assertTrue(all(len(set(document['tags'])) == 3 for document in results))
+        self.assertEqual(len(set(id(producer.plan) for producer in plans)),8)
+        self.assertEqual(len(set(id(producer.generator_cache['root.name']) for producer in plans)),8)
+        #generators drawing from an RNG draw from the thread's
+        self.assertEqual(len(set(id(producer.generator_cache['root.tags.integer']) for producer in plans)),8)
+        self.assertTrue(all(producer.generator_cache['root.tags.integer'].random is producer.random for producer in plans))
+        self.assertEqual(set(id(producer.generator_cache['root.id']) for producer in plans),set([id(dp.shared_generators['root.id'])]))
+        #snapshots hold the shared generators, and threads derive new plans from the snapshot RNG
+        dp = DataProducer(schema,seed = 3,thread_safe = True)
+        dp.produce_list(5)
+        state = dp.getstate()
+        documents = dp.produce_list(5)
+        dp.setstate(state)
+        self.assertEqual(dp.produce_list(5),documents)
+        self.assertEqual(documents[0]['id'],6)
+        self.assertRaises(ValueError,DataProducer,schema,thread_safe = True,profile = True)
+
+    def test_background(self):
+        schema = {
+            "type": "object",
+            "properties": {
+                "id": {"type": "integer","_generator_config": {"generator": "StdIntegerSequence","start": 1,"step": 1}},
+                "value": {"type": "number"}
+            },
+            "required": ["id","value"]
+        }
+        dp = DataProducer(schema)
+        self.assertEqual([document['id'] for document in dp.background(1050,batch_size = 100,prefetch = 2)],range(1,1051))
+        background = dp.background(batch_size = 10,prefetch = 2)
+        self.assertEqual(next(background)['id'],1051)
+        time.sleep(0.3)
+        #2 batches queued, and one waiting for room in the queue
+        self.assertTrue(dp.generator_cache['root.id'].getstate() <= 1050+4*10)
+        background.close()
+        self.assertRaises(ValueError,dp.background,workers = 2)
+        dp = DataProducer(schema,thread_safe = True)
+        ids = [document['id'] for document in dp.background(1000,batch_size = 7,workers = 4)]
+        self.assertEqual(sorted(ids),range(1,1001))
+        dp = DataProducer({"type":"array","minItems":3,"uniqueItems":True,"items":{"type":"string","pattern":"[ab]"}})
+        self.assertRaises(ValueError,list,dp.background(10))
+
+    @unittest.skipIf(asyncio is None,'asyncio is not available')
+    def test_aiter(self):
+        dp = DataProducer({"type":"integer","_generator_config":{"generator":"StdIntegerSequence","start":1,"step":1}})
+        documents = []
+        producer = dp.aiter(25,batch_size = 10)
+        loop = asyncio.get_event_loop()
+        while True:
+            try:
+                documents.append(loop.run_until_complete(producer.__anext__()))
+            except StopAsyncIteration:
+                break
+        self.assertEqual(documents,range(1,26))
+
+        #in a coroutine, as on Python 2 with trollius, while another task runs
+        @asyncio.coroutine
+        def consume(producer):
+            documents = []
+            while True:
+                try:
+                    document = yield asyncio.From(producer.__anext__())
+                except StopAsyncIteration:
+                    break
+                documents.append(document)
+            raise asyncio.Return(documents)
+        ticks = []
+        @asyncio.coroutine
+        def tick():
+            for i in range(3):
+                ticks.append(i)
+                yield asyncio.From(asyncio.sleep(0))
+        results = loop.run_until_complete(asyncio.gather(consume(dp.aiter(25,batch_size = 10)),tick()))
+        self.assertEqual(results[0],range(26,51))
+        self.assertEqual(ticks,[0,1,2])
+
+    def test_iter_produce(self):
+        schema = {
+            "type":"integer",
+            "_generator_config":{"start":0,"step":1,"generator":"StdIntegerSequence"}
+        }
+        dp = DataProducer(schema)
+        iterator = dp.iter_produce(25,batch_size = 10)
+        self.assertEqual(next(iterator),0)
+        self.assertEqual(list(iterator),range(1,25))
+        endless = dp.iter_produce()
+        self.assertEqual([next(endless) for i in range(0,3)],[25,26,27])
+
+    def test_produce_json_batch(self):
+        schema = {
+            "definitions": {
+                "node": {
+                    "type": "object",
+                    "properties": {
+                        "value": {"type": "number","minimum": 0,"maximum": 1},
+                        "children": {"type": "array","minItems": 0,"maxItems": 3,"items": {"$ref": "#/definitions/node"}}
+                    },
+                    "required": ["value"]
+                }
+            },
+            "type": "object",
+            "properties": {
+                "id": {"type": "integer"},
+                "name": {"type": "string","enum": [u"caf\u00e9","a\"b","c\\d"]},
+                "flag": {"type": "boolean"},
+                "nothing": {"type": "null"},
+                "tags": {"type": "array","minItems": 2,"maxItems": 4,"uniqueItems": True,"items": {"type": "integer","minimum": 0,"maximum": 9}},
+                "pair": {"type": "array","items": [{"type": "string"},{"type": "integer"}]},
+                "point": {"type": "object","properties": {"x": {"type": "number"},"y": {"type": "number"}},"required": ["x"]},
+                "tree": {"$ref": "#/definitions/node"}
+            },
+            "required": ["id","name"]
+        }
+        encoded = DataProducer(schema,seed = 4).produce_json_batch(50)
+        self.assertEqual(len(encoded),50)
+        self.assertTrue(all(isinstance(text,str) for text in encoded))
+        self.assertEqual([json.loads(text) for text in encoded],DataProducer(schema,seed = 4).produce_batch(50))
+        self.assertEqual(encode_values([1.5,float('nan'),True,None,'x',{"a":[1]}]),['1.5','NaN','true','null','"x"','{"a":[1]}'])
+        self.assertEqual(encode_values([True,False]),['true','false'])
+        self.assertEqual(DataProducer({"type":"object","properties":{"a":{"type":"integer"}}},seed = 1).produce_json_batch(0),[])
+
+    def test_stream_to(self):
+        schema = {
+            "type":"object",
+            "properties":{
+                "int_a":{
+                    "type":"integer",
+                    "_generator_config":{"start":0,"step":1,"generator":"StdIntegerSequence"}
+                },
+                "string_b":{
+                    "type":"string"
+                }
+            },
+            "required":["int_a","string_b"]
+        }
+        dp = DataProducer(schema)
+        output = io.BytesIO()
+        self.assertEqual(dp.stream_to(output,25,batch_size = 10),25)
+        lines = output.getvalue().splitlines()
+        self.assertEqual([json.loads(line)['int_a'] for line in lines],range(0,25))
+        output = io.BytesIO()
+        self.assertEqual(dp.stream_to(output,5,format = 'json',batch_size = 2),5)
+        self.assertEqual([value['int_a'] for value in json.loads(output.getvalue())],range(25,30))
+        path = tempfile.mktemp()
+        try:
+            self.assertEqual(dp.stream_to(path,3),3)
+            with open(path,'rb') as f:
+                self.assertEqual([json.loads(line)['int_a'] for line in f],[30,31,32])
+        finally:
+            os.remove(path)
+        self.assertRaises(ValueError,dp.stream_to,io.BytesIO(),3,'xml')
+
+    def test_export_table(self):
+        schema = {
+            "type":"object",
+            "properties":{
+                "id":{"type":"integer","_generator_config":{"start":0,"step":1,"generator":"StdIntegerSequence"}},
+                "name":{"type":"string","enum":[u"caf\u00e9","a,b"]},
+                "score":{"type":"number"},
+                "address":{
+                    "type":"object",
+                    "properties":{"city":{"type":"string","maxLength":5},"zip":{"type":"integer"}},
+                    "required":["city"]
+                },
+                "tags":{"type":"array","items":{"type":"boolean"},"maxItems":3}
+            },
+            "required":["id","address"]
+        }
+        dp = DataProducer(schema,seed = 5)
+        columns = dp.table_columns()
+        self.assertEqual(sorted(columns),[('address.city','string'),('address.zip','integer'),('id','integer'),
+                                          ('name','string'),('score','number'),('tags','json')])
+        names = [name for name,column_type in columns]
+        documents = DataProducer(schema,seed = 5).produce_batch(40)
+        rows = zip(*dp.produce_columns(40))
+        for document,row in zip(documents,rows):
+            expected = [document.get('address',{}).get(name[8:]) if name.startswith('address.') else document.get(name) for name in names]
+            expected[names.index('tags')] = json.dumps(document['tags'],separators = (',',':')) if 'tags' in document else None
+            self.assertEqual(list(row),expected)
+        output = io.BytesIO()
+        self.assertEqual(dp.export_table(output,25,batch_size = 10),25)
+        lines = list(csv.reader(io.BytesIO(output.getvalue())))
+        self.assertEqual(lines[0],names)
+        self.assertEqual([int(line[names.index('id')]) for line in lines[1:]],range(40,65))
+        for line in lines[1:]:
+            self.assertIn(line[names.index('name')],['',u"caf\u00e9".encode('utf-8'),'a,b'])
+            if line[names.index('score')]:
+                float(line[names.index('score')])
+            if line[names.index('tags')]:
+                self.assertTrue(all(isinstance(value,bool) for value in json.loads(line[names.index('tags')])))
+        self.assertEqual(dp.produce_columns(0),[[]]*6)
+        self.assertRaises(ValueError,dp.export_table,io.BytesIO(),3,'xml')
+
+    @unittest.skipIf(pyarrow is None,'pyarrow is not installed')
+    def test_export_parquet(self):
+        import pyarrow.parquet
+        schema = {
+            "type":"object",
+            "properties":{
+                "id":{"type":"integer"},
+                "point":{"type":"object","properties":{"x":{"type":"number"},"y":{"type":"number"}}}
+            },
+            "required":["id"]
+        }
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory,'table.parquet')
+            self.assertEqual(DataProducer(schema,seed = 2).export_table(path,25,'parquet',batch_size = 10),25)
+            parquet_file = pyarrow.parquet.ParquetFile(path)
+            self.assertEqual(parquet_file.num_row_groups,3)
+            table = parquet_file.read()
+            self.assertEqual(sorted(table.schema.names),['id','point.x','point.y'])
+            dp = DataProducer(schema,seed = 2)
+            ids = sum([dp.produce_columns(size)[table.schema.names.index('id')] for size in (10,10,5)],[])
+            self.assertEqual(table.column('id').to_pylist(),ids)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_produce_parallel(self):
+        schema = {
+            "type":"object",
+            "properties":{
+                "int_a":{
+                    "type":"integer",
+                    "maximum":1000,
+                    "minimum":0
+                },
+                "string_b":{
+                    "type":"string"
+                },
+                "email_c":{
+                    "type":"string",
+                    "format":"email"
+                }
+            },
+            "required":["int_a"]
+        }
+        dp = DataProducer(schema)
+        results = dp.produce_parallel(45,workers = 2,seed = 7,batch_size = 10)
+        self.assertEqual(len(results),45)
+        for value in results:
+            self.assertIn(value['int_a'],range(0,1001))
+        self.assertEqual(dp.produce_parallel(45,workers = 3,seed = 7,batch_size = 10),results)
+        self.assertNotEqual(dp.produce_parallel(45,workers = 2,seed = 8,batch_size = 10),results)
+        output = io.BytesIO()
+        self.assertEqual(dp.produce_parallel(45,workers = 2,seed = 7,batch_size = 10,output = output),45)
+        self.assertEqual([json.loads(line) for line in output.getvalue().splitlines()],results)
+        self.assertEqual(dp.produce_parallel(0,workers = 2),[])
+        #the producer's seed is the default master seed
+        results = DataProducer(schema,seed = 5).produce_parallel(20,workers = 2,batch_size = 10)
+        self.assertEqual(DataProducer(schema,seed = 5).produce_parallel(20,workers = 2,batch_size = 10),results)
+        self.assertEqual(DataProducer(schema,seed = 5).produce_parallel(20,workers = 2,seed = 5,batch_size = 10),results)
+        dp.seed(5)
+        self.assertEqual(dp.produce_parallel(20,workers = 2,batch_size = 10),results)
+        dp = DataProducer(schema)
+        self.assertEqual(dp.produce_parallel(20,workers = 2,batch_size = 10),dp.produce_parallel(20,workers = 2,batch_size = 10))
+        sequence = {
+            "type":"object",
+            "properties":{
+                "id":{"type":"integer","_generator_config":{"start":1,"step":2,"generator":"StdIntegerSequence"}},
+                "int_a":{"type":"integer"}
+            },
+            "required":["id","int_a"]
+        }
+        dp = DataProducer(sequence)
+        results = dp.produce_parallel(45,workers = 1,seed = 7,batch_size = 10)
+        self.assertEqual([value['id'] for value in results],range(1,91,2))
+        self.assertEqual(dp.produce_parallel(45,workers = 3,seed = 7,batch_size = 10),results)
+        #whichever worker generates it, a shard starts from the values of its first document
+        data_producer._init_worker(dp.resolved,'.',dp.type_vs_generator,False,10,1000)
+        data_producer._produce_shard((1,0,10,False))
+        self.assertEqual([value['id'] for value in data_producer._produce_shard((1,20,10,False))],range(41,61,2))
+        #documents drawing several values from a sequence are given as many values each
+        sequence = {
+            "type":"object",
+            "properties":{
+                "ids":{
+                    "type":"array",
+                    "minItems":3,
+                    "maxItems":3,
+                    "items":{"type":"integer","_generator_config":{"start":0,"step":1,"generator":"StdIntegerSequence"}}
+                },
+                "more":{
+                    "type":"array",
+                    "minItems":0,
+                    "maxItems":2,
+                    "items":{"type":"integer","_generator_config":{"start":0,"step":1,"generator":"StdIntegerSequence"}}
+                }
+            },
+            "required":["ids"]
+        }
+        dp = DataProducer(sequence,seed = 1)
+        results = dp.produce_parallel(18,workers = 2,seed = 1,batch_size = 3)
+        self.assertEqual(sum([value['ids'] for value in results],[]),range(0,18*3))
+        more = sum([value.get('more',[]) for value in results],[])
+        self.assertEqual(len(set(more)),len(more))
+        data_producer._init_worker(dp.resolved,'.',dp.type_vs_generator,False,10,1000)
+        self.assertEqual(data_producer._produce_shard((1,3,3,False))[0]['ids'],[9,10,11])
+        recursive = {
+            "definitions":{
+                "node":{
+                    "type":"object",
+                    "properties":{
+                        "id":{"type":"integer","_generator_config":{"start":0,"step":1,"generator":"StdIntegerSequence"}},
+                        "next":{"$ref":"#/definitions/node"}
+                    }
+                }
+            },
+            "type":"object",
+            "properties":{"list":{"$ref":"#/definitions/node"}}
+        }
+        dp = DataProducer(recursive)
+        data_producer._init_worker(dp.resolved,'.',dp.type_vs_generator,False,10,1000)
+        self.assertRaises(ValueError,data_producer._produce_shard,(1,3,3,False))
+
+    def test_seed(self):
+        schema = {
+            "type":"object",
+            "properties":{
+                "int_a":{
+                    "type":"integer"
+                },
+                "string_b":{
+                    "type":"string",
+                    "pattern":"[a-z]{3,8}"
+                },
+                "email_c":{
+                    "type":"string",
+                    "format":"email"
+                },
+                "list_d":{
+                    "type":"array",
+                    "items":{"type":"number"}
+                }
+            }
+        }
+        dp_a = DataProducer(schema,seed = 5)
+        dp_b = DataProducer(schema,seed = 5)
+        values = dp_a.produce_list(20)
+        self.assertEqual(dp_b.produce_list(20),values)
+        self.assertNotEqual(DataProducer(schema,seed = 6).produce_list(20),values)
+        dp_b.seed(5)
+        self.assertEqual(dp_b.produce_list(20),values)
+
+    def test_produce_at(self):
+        schema = {
+            "definitions":{
+                "node":{
+                    "type":"object",
+                    "properties":{
+                        "value":{"type":"integer","minimum":0,"maximum":9},
+                        "children":{"type":"array","maxItems":2,"items":{"$ref":"#/definitions/node"}}
+                    },
+                    "required":["value"]
+                }
+            },
+            "type":"object",
+            "properties":{
+                "id":{"type":"integer","_generator_config":{"start":10,"step":5,"generator":"StdIntegerSequence"}},
+                "string_b":{"type":"string","pattern":"[a-z]{3,8}"},
+                "email_c":{"type":"string","format":"email"},
+                "tree":{"$ref":"#/definitions/node"}
+            },
+            "required":["id","tree"]
+        }
+        dp = DataProducer(schema,seed = 3)
+        documents = [dp.produce_at(index) for index in (0,7,10**9)]
+        self.assertEqual([document['id'] for document in documents],[10,45,10+5*10**9])
+        other = DataProducer(schema,seed = 3)
+        other.produce_list(5)
+        self.assertEqual([other.produce_at(index) for index in (10**9,7,0)],documents[::-1])
+        self.assertEqual(other.produce_list(5),DataProducer(schema,seed = 3).produce_list(10)[5:])
+        self.assertEqual(DataProducer(schema,seed = 3,thread_safe = True).produce_at(7),documents[1])
+        self.assertEqual(DataProducer(schema,seed = 4).produce_at(7,seed = 3),documents[1])
+        self.assertNotEqual(DataProducer(schema,seed = 4).produce_at(7),documents[1])
+        dp.seed(4)
+        self.assertNotEqual(dp.produce_at(7),documents[1])
+        #documents drawing several values from a sequence do not share them
+        schema = {
+            "type":"object",
+            "properties":{
+                "ids":{
+                    "type":"array",
+                    "minItems":1,
+                    "maxItems":3,
+                    "items":{"type":"integer","_generator_config":{"start":0,"step":1,"generator":"StdIntegerSequence"}}
+                }
+            },
+            "required":["ids"]
+        }
+        dp = DataProducer(schema,seed = 1)
+        ids = [dp.produce_at(index)['ids'] for index in range(20)]
+        self.assertTrue(all(3*index <= value < 3*index+3 for index,values in enumerate(ids) for value in values))
+        self.assertEqual(dp.produce_at(10**6)['ids'][0],3*10**6)
+
+    def test_getstate_setstate(self):
+        schema = {
+            "type":"object",
+            "properties":{
+                "seq_a":{
+                    "type":"integer",
+                    "_generator_config":{"start":0,"step":1,"generator":"StdIntegerSequence"}
+                },
+                "string_b":{
+                    "type":"string"
+                },
+                "ipv4_c":{
+                    "type":"string",
+                    "format":"ipv4"
+                }
+            },
+            "required":["seq_a"]
+        }
+        dp = DataProducer(schema)
+        dp.produce_list(3)
+        state = dp.getstate()
+        values = dp.produce_list(10)
+        dp.setstate(state)
+        self.assertEqual(dp.produce_list(10),values)
+        self.assertEqual(values[0]['seq_a'],3)
+
+    def test_profile(self):
+        schema = {
+            "type": "object",
+            "properties": {
+                "flag": {"type": "integer","minimum": 0,"maximum": 1,"exclusivemaximum": True},
+                "name": {"type": "string","minLength": 3,"maxLength": 3},
+                "tags": {
+                    "type": "array",
+                    "minItems": 5,
+                    "maxItems": 5,
+                    "uniqueItems": True,
+                    "items": {"type": "string","pattern": "[a-c]{1,2}"}
+                }
+            },
+            "required": ["flag","name","tags"]
+        }
+        dp = DataProducer(schema,seed = 1,profile = True)
+        dp.produce_list(20)
+        dp.produce_batch(10)
+        stats = dp.profiler.as_dict()
+        self.assertEqual(sorted(stats.keys()),['root','root.flag','root.name','root.tags','root.tags.string'])
+        self.assertEqual(stats['root']['values'],30)
+        self.assertEqual(stats['root.flag']['values'],30)
+        self.assertTrue(stats['root.flag']['retries'] > 0)
+        self.assertTrue(stats['root.tags']['retries'] > 0)
+        self.assertEqual(stats['root.name']['max_size'],3)
+        self.assertEqual(stats['root.tags']['mean_size'],5.0)
+        self.assertTrue(stats['root']['total_time'] >= stats['root.tags']['total_time'])
+        folded = dp.profiler.folded().splitlines()
+        self.assertIn('root;root.tags;root.tags.string',[line.split(' ')[0] for line in folded])
+        self.assertTrue(all(line.split(' ')[1].isdigit() for line in folded))
+        dp = DataProducer(schema)
+        self.assertEqual(dp.profiler,None)
+        for name,node,required in dp.plan.properties:
+            if isinstance(node,LeafNode):
+                self.assertEqual(node.generate,node.generator.generate)
+
+    def test_compact_plan(self):
+        schema = {
+            "type": "object",
+            "properties": {
+                "a": {"type": "integer","minimum": 0,"maximum": 9},
+                "b": {"type": "integer","maximum": 9,"minimum": 0,"description": "same as a"},
+                "c": {"type": "integer","minimum": 0,"maximum": 8},
+                "d": {"type": "integer","_generator_config": {"generator": "StdIntegerSequence","start": 0,"step": 1}},
+                "e": {"type": "integer","_generator_config": {"generator": "StdIntegerSequence","start": 0,"step": 1}}
+            },
+            "required": ["a","b","c","d","e"]
+        }
+        dp = DataProducer(schema,seed = 2)
+        generators = dict((name,node.generator) for name,node,required in dp.plan.properties)
+        self.assertTrue(generators['a'] is generators['b'])
+        self.assertFalse(generators['a'] is generators['c'])
+        self.assertFalse(generators['d'] is generators['e'])
+        self.assertEqual([(x['d'],x['e']) for x in dp.produce_list(3)],[(0,0),(1,1),(2,2)])
+        for node in [dp.plan]+[node for name,node,required in dp.plan.properties]:
+            self.assertFalse(hasattr(node,'__dict__'))
+        for generator in generators.values():
+            self.assertFalse(hasattr(generator,'__dict__'))
+        #sharing generators leaves the values unchanged
+        unshared = deepcopy(schema)
+        for name in ('a','b','c'):
+            unshared['properties'][name]['_generator_config'] = {"generator": "StdIntegerRandom","key": name}
+        dp_unshared = DataProducer(unshared,seed = 2)
+        self.assertFalse(dp_unshared.generator_cache['root.a'] is dp_unshared.generator_cache['root.b'])
+        dp = DataProducer(schema,seed = 2)
+        self.assertEqual(dp.produce_list(10),dp_unshared.produce_list(10))
+        self.assertEqual(dp.produce_batch(10),dp_unshared.produce_batch(10))
+        dp = DataProducer(schema,seed = 2,profile = True)
+        dp.produce_list(3)
+        self.assertEqual(dp.profiler.as_dict()['root.a']['values'],3)
+        self.assertFalse(hasattr(dp.plan,'__dict__'))
+
     def test_partly_required(self):
         schema = {
             "type":"object",
@@ -545,12 +1658,122 @@ class TestDataGenerate(unittest.TestCase):
             else:
                 b_no_present = True
 
+class SchemaRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    '''Stand-in for a schema registry: serves a single JSON document with an ETag.'''
+    protocol_version = 'HTTP/1.1'
+    body = json.dumps({"definitions":{"code":{"type":"integer","minimum":1,"maximum":3}}})
+    etag = '"v1"'
+    requests = []
+
+    def do_GET(self):
+        self.requests.append((self.client_address,self.path,self.headers.get('If-None-Match')))
+        if self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.send_header('Content-Length','0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag',self.etag)
+        self.send_header('Content-Length',str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self,*args):
+        pass
+
+class TestDocumentCache(unittest.TestCase):
+    def setUp(self):
+        SchemaRequestHandler.requests = []
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1',0),SchemaRequestHandler)
+        self.thread = threading.Thread(target = self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.base_uri = 'http://127.0.0.1:{0}/schemas'.format(self.server.server_address[1])
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.cache_dir)
+
+    def schema(self):
+        return {
+            "id": self.base_uri,
+            "type": "object",
+            "properties": {
+                "code": {"$ref": "registry.json#/definitions/code"}
+            },
+            "required": ["code"]
+        }
+
+    def test_remote_ref_fetched_once(self):
+        cache = DocumentCache(ttl = 300)
+        for i in range(0,5):
+            dp = DataProducer(self.schema(),document_cache = cache)
+            self.assertIn(dp.produce()['code'],range(1,4))
+        self.assertEqual(len(SchemaRequestHandler.requests),1)
+        self.assertEqual(SchemaRequestHandler.requests[0][1],'/schemas/registry.json')
+
+    def test_revalidation_reuses_connection(self):
+        cache = DocumentCache(ttl = 0)
+        for i in range(0,3):
+            dp = DataProducer(self.schema(),document_cache = cache)
+        self.assertEqual([etag for address,path,etag in SchemaRequestHandler.requests],[None,'"v1"','"v1"'])
+        #all requests went through the same keep-alive connection
+        self.assertEqual(len(set(address for address,path,etag in SchemaRequestHandler.requests)),1)
+        cache.pool.close()
+
+    def test_disk_cache(self):
+        DataProducer(self.schema(),document_cache = DocumentCache(cache_dir = self.cache_dir))
+        dp = DataProducer(self.schema(),document_cache = DocumentCache(cache_dir = self.cache_dir))
+        self.assertIn(dp.produce()['code'],range(1,4))
+        self.assertEqual(len(SchemaRequestHandler.requests),1)
+
+    def test_local_file_mtime(self):
+        path = os.path.join(self.cache_dir,'local.json')
+        with open(path,'wb') as f:
+            f.write(json.dumps({"type":"integer","minimum":1,"maximum":1}))
+        cache = DocumentCache(ttl = 0)
+        schema = {"type":"object","properties":{"a":{"$ref":"local.json#"}},"required":["a"]}
+        self.assertEqual(DataProducer(deepcopy(schema),self.cache_dir,document_cache = cache).produce(),{"a":1})
+        with open(path,'wb') as f:
+            f.write(json.dumps({"type":"integer","minimum":2,"maximum":2}))
+        os.utime(path,(time.time()+10,time.time()+10))
+        self.assertEqual(DataProducer(deepcopy(schema),self.cache_dir,document_cache = cache).produce(),{"a":2})
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_heavy_dependencies_imported_lazily(self):
+        result = benchmark.import_time(runs = 1)
+        self.assertEqual(result['heavy_modules'],[])
+
+    def test_measure_and_compare(self):
+        self.assertIn('test_integer.json',benchmark.schema_names())
+        self.assertIn('wide',benchmark.schema_names())
+        metrics = benchmark.measure('deep',runs = 1,count = 5)
+        for metric in set(benchmark.METRICS)-set(['bytes_per_field']):
+            self.assertTrue(metrics[metric] > 0,metric)
+        baseline = {'schemas':{'deep':metrics}}
+        self.assertEqual(benchmark.compare({'schemas':{'deep':metrics}},baseline),[])
+        slower = dict(metrics,init_seconds = metrics['init_seconds']*2,produce_list_per_second = metrics['produce_list_per_second']/2)
+        regressions = benchmark.compare({'schemas':{'deep':slower}},baseline)
+        self.assertEqual(sorted(regression['metric'] for regression in regressions),['init_seconds','produce_list_per_second'])
+
+    def test_field_memory(self):
+        result = benchmark.field_memory(fields = 200)
+        self.assertEqual(result['fields'],200)
+        self.assertIn('bytes_per_field',result)
+        distinct = benchmark.wide_schema(12,distinct = True)['properties']
+        self.assertEqual(len(set(json.dumps(leaf,sort_keys = True) for leaf in distinct.values())),11)
+
 def Data_Suite():
     ts =unittest.TestSuite()
     #ts.addTest(unittest.makeSuite(TestInteger))
     #ts.addTest(unittest.makeSuite(TestFloat))
     ts.addTest(unittest.makeSuite(TestSchemaParse))
     ts.addTest(unittest.makeSuite(TestDataGenerate))
+    ts.addTest(unittest.makeSuite(TestDocumentCache))
+    ts.addTest(unittest.makeSuite(TestBenchmark))
     return ts
 
 if __name__ == '__main__':